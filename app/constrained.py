@@ -0,0 +1,431 @@
+# Décodage contraint par le schéma JSON (inférence locale, transformers)
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+_WS = " \t\n\r"
+_DIGITS = "0123456789"
+_HEX = "0123456789abcdefABCDEF"
+MAX_WS_RUN = 32  # blancs consécutifs tolérés hors chaînes (évite les boucles d'espaces)
+
+# YYYY-MM-DD : caractères admis à chaque position d'une chaîne format "date"
+_DATE = [_DIGITS] * 4 + ["-", "0123", _DIGITS, "-", "0123", _DIGITS]  # mois 0x/1x, jour 0x..3x
+
+
+# ─────────────────────────────
+# Schéma compilé
+# ─────────────────────────────
+class _Node:
+    __slots__ = ("types", "props", "required", "items", "fmt", "nonneg", "unit")
+
+    def __init__(self):
+        self.types: frozenset = frozenset()
+        self.props: Dict[str, int] = {}
+        self.required: frozenset = frozenset()
+        self.items: Optional[int] = None
+        self.fmt: Optional[str] = None
+        self.nonneg = False  # minimum >= 0 : pas de signe '-'
+        self.unit = False    # 0 <= x <= 1
+
+
+_ALL_TYPES = frozenset({"object", "array", "string", "number", "integer", "boolean", "null"})
+
+
+class SchemaAutomaton:
+    """
+    Automate à pile, caractère par caractère, des préfixes JSON valides pour
+    un schéma (sous-ensemble Draft 7 utilisé par MedicalRecord : type simple
+    ou liste, properties/required, items, format date, minimum/maximum).
+    Plus strict que le schéma : seules les clés déclarées, chacune une fois,
+    et '}' refusé tant qu'une clé requise manque.
+
+    Un état est un tuple (pile, blancs consécutifs), hashable : les masques de
+    tokens calculés pour un état sont réutilisés tant que l'état se répète.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self.nodes: List[_Node] = []
+        self.root = self._compile(schema)
+
+    def _resolve(self, sch: Dict[str, Any]) -> Dict[str, Any]:
+        while "$ref" in sch:
+            ref = sch["$ref"]
+            if not ref.startswith("#/"):
+                raise ValueError(f"$ref non local non pris en charge : {ref}")
+            target: Any = self.schema
+            for part in ref[2:].split("/"):
+                target = target[part]
+            sch = target
+        return sch
+
+    def _compile(self, sch: Dict[str, Any]) -> int:
+        sch = self._resolve(sch)
+        node = _Node()
+        nid = len(self.nodes)
+        self.nodes.append(node)
+        t = sch.get("type")
+        node.types = frozenset([t] if isinstance(t, str) else t) if t else _ALL_TYPES
+        node.props = {k: self._compile(v) for k, v in (sch.get("properties") or {}).items()}
+        node.required = frozenset(sch.get("required") or ())
+        if "items" in sch:
+            node.items = self._compile(sch["items"])
+        node.fmt = sch.get("format") if sch.get("format") == "date" else None
+        lo, hi = sch.get("minimum"), sch.get("maximum")
+        node.nonneg = lo is not None and lo >= 0
+        node.unit = node.nonneg and hi is not None and hi <= 1
+        return nid
+
+    # ── états ────────────────────────────────
+    def start(self) -> Tuple:
+        return ((("root", self.root, False),), 0)
+
+    @staticmethod
+    def is_done(state: Optional[Tuple]) -> bool:
+        return state is not None and len(state[0]) == 1 and state[0][0][2] is True
+
+    def advance_text(self, state: Optional[Tuple], text: str) -> Optional[Tuple]:
+        for ch in text:
+            if state is None:
+                return None
+            state = self.advance(state, ch)
+        return state
+
+    def advance(self, state: Tuple, ch: str) -> Optional[Tuple]:
+        stack, ws = state
+        top = stack[-1]
+        kind = top[0]
+
+        if kind == "str":
+            frame = self._str_step(top, ch)
+            if frame is None:
+                return None
+            return (stack[:-1] if frame == "close" else stack[:-1] + (frame,), 0)
+
+        if kind == "key":
+            return self._key_step(stack, ch)
+
+        if kind == "lit":
+            if ch != top[1][0]:
+                return None
+            rest = top[1][1:]
+            return (stack[:-1] + (("lit", rest),) if rest else stack[:-1], 0)
+
+        if kind == "num":
+            frame = self._num_step(top, ch)
+            if frame is not None:
+                return (stack[:-1] + (frame,), 0)
+            if top[2] not in _NUM_FINAL:
+                return None
+            stack, top = stack[:-1], stack[-2]  # nombre terminé : le caractère revient au parent
+            kind = top[0]
+
+        # cadres structurels : root / obj / arr
+        if ch in _WS:
+            if self.is_done((stack, ws)) or ws >= MAX_WS_RUN:
+                return None
+            return (stack, ws + 1)
+
+        if kind == "root":
+            if top[2]:
+                return None  # objet racine refermé : plus rien
+            return self._start_value(stack[:-1] + (("root", top[1], True),), top[1], ch)
+
+        if kind == "obj":
+            _, nid, seen, phase, cur = top
+            node = self.nodes[nid]
+            rest = stack[:-1]
+            if phase in ("key_or_end", "key") and ch == '"':
+                if not (node.props.keys() - seen):
+                    return None
+                return (rest + (("obj", nid, seen, "in_key", None), ("key", "")), 0)
+            if phase in ("key_or_end", "comma_or_end") and ch == "}":
+                return (rest, 0) if node.required <= seen else None
+            if phase == "colon" and ch == ":":
+                return (rest + (("obj", nid, seen, "value", cur),), 0)
+            if phase == "value":
+                return self._start_value(rest + (("obj", nid, seen, "comma_or_end", None),), node.props[cur], ch)
+            if phase == "comma_or_end" and ch == ",":
+                if not (node.props.keys() - seen):
+                    return None
+                return (rest + (("obj", nid, seen, "key", None),), 0)
+            return None
+
+        if kind == "arr":
+            _, nid, phase = top
+            rest = stack[:-1]
+            if phase in ("first", "comma_or_end") and ch == "]":
+                return (rest, 0)
+            if phase == "comma_or_end":
+                return (rest + (("arr", nid, "value"),), 0) if ch == "," else None
+            return self._start_value(rest + (("arr", nid, "comma_or_end"),), self.nodes[nid].items, ch)
+
+        return None
+
+    # ── valeurs ──────────────────────────────
+    def _start_value(self, stack: Tuple, nid: Optional[int], ch: str) -> Optional[Tuple]:
+        node = self.nodes[nid] if nid is not None else None
+        types = node.types if node is not None else _ALL_TYPES
+        if ch == "{" and "object" in types:
+            if node is None:
+                return None  # objet libre : non contraint, refusé
+            return (stack + (("obj", nid, frozenset(), "key_or_end", None),), 0)
+        if ch == "[" and "array" in types:
+            if node is None or node.items is None:
+                return None  # tableau sans schéma d'éléments : refusé
+            return (stack + (("arr", nid, "first"),), 0)
+        if ch == '"' and "string" in types:
+            fmt = node.fmt if node is not None else None
+            return (stack + (("str", fmt, 0, 0),), 0)
+        if ch == "n" and "null" in types:
+            return (stack + (("lit", "ull"),), 0)
+        if ch in "tf" and "boolean" in types:
+            return (stack + (("lit", "rue" if ch == "t" else "alse"),), 0)
+        if (ch == "-" or ch in _DIGITS) and types & {"number", "integer"}:
+            flags = (bool(node and node.nonneg), bool(node and node.unit), "number" not in types)
+            frame = self._num_start(flags, ch)
+            return (stack + (frame,), 0) if frame is not None else None
+        return None
+
+    @staticmethod
+    def _str_step(frame: Tuple, ch: str):
+        _, fmt, pos, esc = frame
+        if esc == 1:
+            if ch == "u":
+                return ("str", fmt, pos, 2)
+            return ("str", fmt, pos, 0) if ch in '"\\/bfnrt' else None
+        if esc:
+            if ch not in _HEX:
+                return None
+            return ("str", fmt, pos, 0 if esc == 5 else esc + 1)
+        if fmt == "date":
+            if ch == '"':
+                return "close" if pos == len(_DATE) else None
+            return ("str", fmt, pos + 1, 0) if pos < len(_DATE) and ch in _DATE[pos] else None
+        if ch == '"':
+            return "close"
+        if ch == "\\":
+            return ("str", fmt, pos, 1)
+        if ord(ch) < 0x20:
+            return None
+        return frame
+
+    def _key_step(self, stack: Tuple, ch: str) -> Optional[Tuple]:
+        buf = stack[-1][1]
+        _, nid, seen, _, _ = stack[-2]
+        props = self.nodes[nid].props
+        if ch == '"':
+            if buf not in props or buf in seen:
+                return None
+            return (stack[:-2] + (("obj", nid, seen | {buf}, "colon", buf),), 0)
+        cand = buf + ch
+        if not any(k.startswith(cand) for k in props if k not in seen):
+            return None
+        return (stack[:-1] + (("key", cand),), 0)
+
+    @staticmethod
+    def _num_start(flags: Tuple, ch: str) -> Optional[Tuple]:
+        nonneg, unit, _ = flags
+        if ch == "-":
+            return None if nonneg else ("num", flags, "sign")
+        if ch == "0":
+            return ("num", flags, "zero")
+        if unit:
+            return ("num", flags, "one") if ch == "1" else None
+        return ("num", flags, "int")
+
+    @staticmethod
+    def _num_step(frame: Tuple, ch: str) -> Optional[Tuple]:
+        _, flags, phase = frame
+        _, unit, integer = flags
+        nxt = None
+        if phase == "sign":
+            nxt = "zero" if ch == "0" else "int" if ch in _DIGITS else None
+        elif phase == "int" and ch in _DIGITS:
+            nxt = "int"
+        elif phase in ("zero", "int", "one") and ch == "." and not integer:
+            nxt = "dot_one" if phase == "one" else "dot"
+        elif phase in ("dot", "frac") and ch in _DIGITS:
+            nxt = "frac"
+        elif phase in ("dot_one", "frac_one") and ch == "0":
+            nxt = "frac_one"
+        elif phase in ("zero", "int", "frac") and ch in "eE" and not unit:
+            nxt = "exp"
+        elif phase == "exp" and ch in "+-":
+            nxt = "exp_sign"
+        elif phase in ("exp", "exp_sign", "exp_digits") and ch in _DIGITS:
+            nxt = "exp_digits"
+        return ("num", flags, nxt) if nxt else None
+
+
+_NUM_FINAL = frozenset({"zero", "int", "one", "frac", "frac_one", "exp_digits"})
+
+
+# ─────────────────────────────
+# Vocabulaire : texte de chaque token + trie
+# ─────────────────────────────
+def token_strings(tok) -> List[str]:
+    """
+    Texte produit par chaque id (chaîne vide = jamais autorisé) :
+    SentencePiece ('▁' → espace, <0xNN> → caractère ASCII) ou BPE octets (GPT-2).
+    """
+    pieces = tok.convert_ids_to_tokens(list(range(len(tok))))
+    special = set(tok.all_special_ids)
+    sentencepiece = any(p.startswith("▁") for p in pieces[:2000] if p)
+    out: List[str] = []
+    for i, p in enumerate(pieces):
+        if i in special or p is None:
+            out.append("")
+        elif p.startswith("<0x") and p.endswith(">") and len(p) == 6:
+            b = int(p[3:5], 16)
+            out.append(chr(b) if b < 0x80 else "")  # octets UTF-8 isolés : non gérés
+        elif sentencepiece:
+            out.append(p.replace("▁", " "))
+        else:
+            out.append(tok.convert_tokens_to_string([p]))
+    return out
+
+
+class _Trie:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_Trie"] = {}
+        self.ids: List[int] = []
+
+
+def build_trie(strings: Sequence[str]) -> _Trie:
+    root = _Trie()
+    for i, s in enumerate(strings):
+        if not s:
+            continue
+        node = root
+        for ch in s:
+            node = node.children.setdefault(ch, _Trie())
+        node.ids.append(i)
+    return root
+
+
+class SchemaConstraint:
+    """
+    Objets partagés par toutes les générations d'un modèle : automate, textes
+    des tokens, trie, et cache LRU état → masque des tokens autorisés.
+    Un masque se calcule en parcourant le trie depuis l'état courant : une
+    branche est coupée dès que son préfixe sort du langage. Dans une chaîne
+    libre, les tokens sans '"', '\\' ni caractère de contrôle sont toujours
+    admis : seul le petit trie des autres tokens est parcouru.
+    """
+
+    def __init__(self, tok, schema: Dict[str, Any], max_masks: int = 2048):
+        self.automaton = SchemaAutomaton(schema)
+        self.strings = token_strings(tok)
+        self.trie = build_trie(self.strings)
+        plain = [bool(t) and not any(ch in '"\\' or ord(ch) < 0x20 for ch in t) for t in self.strings]
+        self.plain_ids = [i for i, p in enumerate(plain) if p]
+        self.special_trie = build_trie([t if not p else "" for t, p in zip(self.strings, plain)])
+        self.eos_id = tok.eos_token_id
+        self.vocab_size = len(self.strings)
+        self.max_masks = max_masks
+        self._masks: "OrderedDict[Tuple, torch.Tensor]" = OrderedDict()
+
+    @classmethod
+    def from_schema_file(cls, tok, path: str | Path) -> "SchemaConstraint":
+        return cls(tok, json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def allowed_ids(self, state: Tuple) -> List[int]:
+        top = state[0][-1]
+        if top[0] == "str" and top[1] is None and top[3] == 0:
+            out, trie = list(self.plain_ids), self.special_trie
+        else:
+            out, trie = [], self.trie
+        advance = self.automaton.advance
+        todo = [(trie, state)]
+        while todo:
+            node, st = todo.pop()
+            for ch, child in node.children.items():
+                nxt = advance(st, ch)
+                if nxt is not None:
+                    out.extend(child.ids)
+                    if child.children:
+                        todo.append((child, nxt))
+        return out
+
+    def mask(self, state: Optional[Tuple], size: int, device) -> torch.Tensor:
+        """Masque booléen (True = autorisé) ; EOS seul une fois la racine refermée."""
+        key = (state, size, str(device))
+        m = self._masks.get(key)
+        if m is not None:
+            self._masks.move_to_end(key)
+            return m
+        m = torch.zeros(size, dtype=torch.bool)
+        if state is None or self.automaton.is_done(state):
+            ids = [self.eos_id]
+        else:
+            ids = self.allowed_ids(state) or [self.eos_id]
+        m[torch.tensor(ids, dtype=torch.long)] = True
+        m = m.to(device)
+        self._masks[key] = m
+        if len(self._masks) > self.max_masks:
+            self._masks.popitem(last=False)
+        return m
+
+    def processors(self) -> Tuple["SchemaLogitsProcessor", "JsonDoneCriteria"]:
+        """Un couple (LogitsProcessor, StoppingCriteria) pour un appel à generate()."""
+        proc = SchemaLogitsProcessor(self)
+        return proc, JsonDoneCriteria(proc)
+
+
+# ─────────────────────────────
+# Intégration transformers
+# ─────────────────────────────
+class SchemaLogitsProcessor(LogitsProcessor):
+    """
+    Suit l'état de l'automate de chaque ligne du lot à partir des tokens
+    générés et met à -inf les logits des tokens qui sortiraient du schéma.
+    """
+
+    def __init__(self, constraint: SchemaConstraint):
+        self.c = constraint
+        self.prompt_len: Optional[int] = None
+        self.states: List[Optional[Tuple]] = []
+        self.seen: List[int] = []
+
+    def sync(self, input_ids: torch.LongTensor) -> None:
+        if self.prompt_len is None:
+            self.prompt_len = input_ids.shape[1]
+            self.states = [self.c.automaton.start()] * input_ids.shape[0]
+            self.seen = [0] * input_ids.shape[0]
+        for row in range(input_ids.shape[0]):
+            new = input_ids[row, self.prompt_len + self.seen[row]:].tolist()
+            st = self.states[row]
+            for tid in new:
+                if st is None or self.c.automaton.is_done(st):
+                    break  # ligne terminée : EOS/padding ignorés
+                text = self.c.strings[tid] if tid < self.c.vocab_size else ""
+                st = self.c.automaton.advance_text(st, text) if text else None
+            self.states[row] = st
+            self.seen[row] += len(new)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        self.sync(input_ids)
+        for row, st in enumerate(self.states):
+            allowed = self.c.mask(st, scores.shape[-1], scores.device)
+            scores[row] = scores[row].masked_fill(~allowed, float("-inf"))
+        return scores
+
+    def done(self) -> List[bool]:
+        return [st is None or self.c.automaton.is_done(st) for st in self.states]
+
+
+class JsonDoneCriteria(StoppingCriteria):
+    """Arrêt dès que l'objet racine est refermé (par ligne du lot)."""
+
+    def __init__(self, processor: SchemaLogitsProcessor):
+        self.proc = processor
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        self.proc.sync(input_ids)
+        return torch.tensor(self.proc.done(), dtype=torch.bool, device=input_ids.device)
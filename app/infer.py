@@ -1,12 +1,22 @@
-import torch, json, re
+import copy, threading, torch, json, re
 from datetime import datetime
 from pathlib import Path
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import (
+    AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, DynamicCache,
+    LogitsProcessorList, StoppingCriteriaList,
+)
+from .constrained import SchemaConstraint
 from .settings import settings
+from .services.prompts import CONDENSED_SCHEMA
 
-today = datetime.now().strftime("%Y-%m-%d")
+# marque la place du document dans le prompt rendu par le chat template
+_DOC_SENTINEL = "\x00DOCUMENT\x00"
 
-def build_prompt(raw_text: str) -> str:
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+def build_prompt(raw_text: str, today: str | None = None) -> str:
+    today = today or _today()
     # ⚠️ Pas de [INST] ici : on utilise apply_chat_template qui gère le format de discussion.
     return f"""Tu es un extracteur clinique.
 Objectif : À partir du texte source, produis STRICTEMENT un JSON conforme au schéma.
@@ -19,14 +29,7 @@ Règles strictes :
 - Respecte toutes les clés attendues par le schéma.
 
 Schéma condensé :
-- patient (id|null, nom, date_naissance, sexe, adresse|null)
-- antecedents_medicaux[] (condition, date_diagnostic|null, status|null, type|null, gravite|null)
-- traitements_actuels[] (medicament, dose|null, posologie|null, indication|null, debut_traitement|null, fin_traitement|null)
-- consultations[] (date, motif|null, observations|null, diagnostic|null, traitement_prescrit|null)
-- examens[] (date, type, resultat|null)
-- resume_structure (maladies[] {{nom, premiere_mention|null, statut|null, derniere_consultation|null, confiance|null[0..1]}}, allergies[], traitements[])
-- meta (langue, source, date_extraction, modele_utilise, confiance_moyenne|null[0..1], schema_version)
-- document_source (nom_fichier, type, id_document|null)
+{CONDENSED_SCHEMA}
 
 Contraintes meta :
 - meta.langue = "fr"
@@ -77,28 +80,113 @@ class ModelWrapper:
         if self.tok.pad_token is None:
             self.tok.pad_token = self.tok.eos_token
 
-    def generate(self, text: str) -> str:
+        # cache KV du préambule statique (règles + schéma), recalculé si la date change
+        self._prefix_lock = threading.Lock()
+        self._prefix: tuple[str, torch.Tensor, DynamicCache, str] | None = None
+        if settings.use_prefix_cache:
+            self.prefix_state()
+
+        # décodage contraint : automate + trie du vocabulaire, construits une fois
+        self._constraint: SchemaConstraint | None = None
+
+    def constraint_kwargs(self, constrained: bool | None = None) -> dict:
+        """
+        logits_processor / stopping_criteria de generate() : seuls les tokens qui
+        gardent la sortie préfixe d'un MedicalRecord valide sont permis, et la
+        génération s'arrête dès que l'objet racine est refermé.
+        """
+        if not (settings.constrained_decoding if constrained is None else constrained):
+            return {}
+        if self._constraint is None:
+            self._constraint = SchemaConstraint.from_schema_file(self.tok, settings.schema_path)
+        proc, stop = self._constraint.processors()
+        return {"logits_processor": LogitsProcessorList([proc]), "stopping_criteria": StoppingCriteriaList([stop])}
+
+    def _render(self, text: str, today: str) -> str:
         messages = [
             {"role": "system", "content": "Tu es un extracteur clinique."},
-            {"role": "user", "content": build_prompt(text)},
+            {"role": "user", "content": build_prompt(text, today)},
         ]
-        prompt = self.tok.apply_chat_template(
+        return self.tok.apply_chat_template(
             messages, tokenize=False, add_generation_prompt=True
         )
-        inputs = self.tok(prompt, return_tensors="pt").to(self.model.device)
+
+    def prefix_state(self) -> tuple[torch.Tensor, DynamicCache, str]:
+        """
+        (ids du préfixe, cache KV du préfixe, suffixe du gabarit) pour la date du jour.
+        Le prompt est rendu une fois avec une sentinelle à la place du document :
+        tout ce qui précède est identique d'un appel à l'autre et n'est encodé
+        (prefill) qu'une seule fois.
+        """
+        today = _today()
+        with self._prefix_lock:
+            if self._prefix is None or self._prefix[0] != today:
+                prefix, suffix = self._render(_DOC_SENTINEL, today).split(_DOC_SENTINEL)
+                ids = self.tok(prefix, return_tensors="pt")["input_ids"].to(self.model.device)
+                cache = DynamicCache()
+                with torch.inference_mode():
+                    self.model(input_ids=ids, past_key_values=cache, use_cache=True)
+                self._prefix = (today, ids, cache, suffix)
+            _, ids, cache, suffix = self._prefix
+        return ids, cache, suffix
+
+    def generate(self, text: str, max_new_tokens: int | None = None,
+                 use_prefix_cache: bool | None = None, constrained: bool | None = None) -> str:
+        use_prefix_cache = settings.use_prefix_cache if use_prefix_cache is None else use_prefix_cache
+        gen_kwargs = dict(
+            max_new_tokens=max_new_tokens or settings.max_new_tokens,
+            temperature=settings.temperature,
+            top_p=settings.top_p,
+            do_sample=False,
+            **self.constraint_kwargs(constrained),
+        )
+
+        if use_prefix_cache:
+            # seuls le document, la fin du gabarit et les tokens générés sont calculés
+            prefix_ids, prefix_cache, suffix = self.prefix_state()
+            rest = self.tok(text + suffix, add_special_tokens=False, return_tensors="pt")["input_ids"]
+            input_ids = torch.cat([prefix_ids, rest.to(self.model.device)], dim=1)
+            inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+            # copie : generate() étend le cache, le préfixe doit rester intact
+            gen_kwargs["past_key_values"] = copy.deepcopy(prefix_cache)
+        else:
+            prompt = self._render(text, _today())
+            inputs = self.tok(prompt, return_tensors="pt").to(self.model.device)
+
+        with torch.inference_mode():
+            out = self.model.generate(**inputs, **gen_kwargs)
+
+        # ➜ ne décoder que les nouveaux tokens (on enlève l'input)
+        gen_only = out[0][inputs["input_ids"].shape[1]:]
+        return self.tok.decode(gen_only, skip_special_tokens=True)
+
+    def generate_batch(self, texts: list[str], max_new_tokens: int | None = None,
+                       constrained: bool | None = None) -> list[str]:
+        """
+        Un seul model.generate pour plusieurs documents, alignés par padding à
+        gauche (les nouveaux tokens commencent à la même position pour tous).
+        Un lot d'un seul document passe par generate() et son cache de préfixe.
+        """
+        if len(texts) == 1:
+            return [self.generate(texts[0], max_new_tokens=max_new_tokens, constrained=constrained)]
+        today = _today()
+        prompts = [self._render(t, today) for t in texts]
+        self.tok.padding_side = "left"
+        inputs = self.tok(prompts, return_tensors="pt", padding=True).to(self.model.device)
 
         with torch.inference_mode():
             out = self.model.generate(
                 **inputs,
-                max_new_tokens=settings.max_new_tokens,
+                max_new_tokens=max_new_tokens or settings.max_new_tokens,
                 temperature=settings.temperature,
                 top_p=settings.top_p,
-                do_sample=False
+                do_sample=False,
+                pad_token_id=self.tok.pad_token_id,
+                **self.constraint_kwargs(constrained),
             )
 
-        # ➜ ne décoder que les nouveaux tokens (on enlève l'input)
-        gen_only = out[0][inputs["input_ids"].shape[1]:]
-        return self.tok.decode(gen_only, skip_special_tokens=True)
+        gen_only = out[:, inputs["input_ids"].shape[1]:]
+        return self.tok.batch_decode(gen_only, skip_special_tokens=True)
 
 # singleton (chargement 1 seule fois)
 model_wrapped: ModelWrapper | None = None
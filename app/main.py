@@ -1,14 +1,84 @@
 # app/main.py
+import logging, time
+from contextlib import asynccontextmanager
+from pathlib import Path
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
+from .middleware import BodySizeLimitMiddleware, ServerTimingMiddleware
+from .scheduler import close_scheduler
+from .settings import settings
 from .routers.extract import router as extract_router
 from .routers.index import router as index_router  # 👈 importer le router index
+from .routers.search import router as search_router
+from .routers.metrics import router as metrics_router
+from .routers.jobs import router as jobs_router
+from .services.embeddings import close_embeddings_client, get_backend
+from .services.extractor import aclose_mistral_client, get_mistral_client, get_prompts, get_validator
+from .services.jobs import start_job_workers, stop_job_workers
+from .services.pdf_text import shutdown_pdf_pool
+from .services.vectors_qdrant import close_qdrant_client, get_qdrant_client
+
+logger = logging.getLogger(__name__)
+
+async def warmup() -> dict:
+    """
+    Prépare ce qui est sinon créé à la première requête : schéma + validateur,
+    prompts précompilés, connexions Mistral et Qdrant. Une étape en échec
+    est journalisée sans empêcher le démarrage. Renvoie la durée de chaque étape (ms).
+    """
+    async def step(name, fn):
+        t0 = time.perf_counter()
+        try:
+            await fn()
+        except Exception as e:
+            logger.warning("warmup %s : %s", name, e)
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    async def schema():
+        get_validator()
+        get_prompts()
+
+    async def mistral():
+        if settings.mistral_api_key:
+            await get_mistral_client().models.list_async()  # ouvre la connexion TLS keep-alive
+
+    async def embeddings():
+        backend = get_backend()
+        if backend.name == "mistral" and settings.mistral_api_key:
+            backend.client()
+
+    async def qdrant():
+        if settings.qdrant_host:
+            await run_in_threadpool(get_qdrant_client().get_collections)
+
+    timings: dict = {}
+    for name, fn in (("schema", schema), ("mistral", mistral), ("embeddings", embeddings), ("qdrant", qdrant)):
+        await step(name, fn)
+    logger.info("warmup (ms) : %s", timings)
+    return timings
+
+# Démarrage : rien de lourd à l'import, warmup optionnel ;
+# arrêt : fermeture des pools de connexions (Mistral, embeddings, Qdrant), du micro-batching local et du pool PDF
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    Path(settings.outputs_dir).mkdir(parents=True, exist_ok=True)  # pas à l'import
+    app.state.warmup = await warmup() if settings.warmup_on_startup else None
+    start_job_workers()  # reprend les jobs restés en file avant l'arrêt
+    yield
+    await stop_job_workers()
+    await aclose_mistral_client()
+    close_embeddings_client()
+    close_qdrant_client()
+    close_scheduler()
+    shutdown_pdf_pool()
 
 app = FastAPI(
     title="Medical Doc Extract API",
     version="1.0.0",
     description="Extraction structurée (JSON) depuis documents médicaux via Mistral API",
+    lifespan=lifespan,
 )
 
 # CORS (ouvre si tu as un front web)
@@ -20,14 +90,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Taille max des uploads, vérifiée pendant la réception du corps
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/extract-file": settings.max_upload_bytes,
+        "/extract-batch": settings.max_batch_upload_bytes,
+        "/jobs": settings.max_upload_bytes,
+    },
+    # marge pour l'enveloppe multipart (absente du message d'erreur)
+    margins={"/extract-file": 64 * 1024, "/jobs": 64 * 1024},
+)
+
+# Server-Timing (durée de chaque étape) sur toutes les réponses, si metrics_enabled
+app.add_middleware(ServerTimingMiddleware)
+
 @app.get("/")
 def root():
     return {
         "status": "ok",
         "endpoints": [
             "/extract",
+            "/extract-stream",
             "/extract-file",
+            "/extract-batch",
             "/index-json",
+            "/index-batch",
+            "/search",
+            "/search-batch",
+            "/jobs",
+            "/cache/stats",
+            "/metrics",
             "/docs",
         ],
     }
@@ -35,3 +128,6 @@ def root():
 # 👉 Enregistrer les routers ici
 app.include_router(extract_router)
 app.include_router(index_router)   # 👈 maintenant /index-json est connu de FastAPI
+app.include_router(search_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
@@ -0,0 +1,180 @@
+# Métriques internes : histogrammes, compteurs, export Prometheus et Server-Timing
+import bisect, threading, time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .settings import settings
+
+ENABLED = settings.metrics_enabled
+PREFIX = "medextract"
+# secondes : du scan JSON (ms) à l'appel LLM (dizaines de s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (format proche de Prometheus)."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # dernière case : +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        with self._lock:
+            out, total = [], 0
+            for bound, n in zip(self.bounds + ["+Inf"], self.counts):
+                total += n
+                out.append((str(bound), total))
+            return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"buckets": dict(self.cumulative()), "count": self.count, "sum": round(self.sum, 3),
+                "mean": round(self.sum / self.count, 3) if self.count else None}
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1) -> None:
+        with self._lock:
+            self.value += value
+
+
+class Registry:
+    """Séries indexées par (nom, labels) ; rendu au format texte Prometheus 0.0.4."""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], Counter] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def histogram(self, name: str, labels: Labels = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        key = (name, labels)
+        h = self._histograms.get(key)
+        if h is None:
+            with self._lock:
+                h = self._histograms.setdefault(key, Histogram(buckets))
+        return h
+
+    def counter(self, name: str, labels: Labels = ()) -> Counter:
+        key = (name, labels)
+        c = self._counters.get(key)
+        if c is None:
+            with self._lock:
+                c = self._counters.setdefault(key, Counter())
+        return c
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for kind, series in (("counter", self._counters), ("histogram", self._histograms)):
+            by_name: Dict[str, list] = {}
+            for (name, labels), metric in sorted(series.items()):
+                by_name.setdefault(name, []).append((labels, metric))
+            for name, items in by_name.items():
+                full = f"{PREFIX}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {kind}")
+                for labels, metric in items:
+                    if kind == "counter":
+                        lines.append(f"{full}{_fmt_labels(labels)} {metric.value:g}")
+                        continue
+                    for le, n in metric.cumulative():
+                        lines.append(f"{full}_bucket{_fmt_labels(labels + (('le', le),))} {n}")
+                    lines.append(f"{full}_sum{_fmt_labels(labels)} {metric.sum:.6f}")
+                    lines.append(f"{full}_count{_fmt_labels(labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+registry = Registry()
+registry.describe("stage_seconds", "Durée de chaque étape du pipeline (pdf, prompt, llm, json, validate, passages, embeddings, upsert, ...)")
+registry.describe("cache_requests_total", "Consultations du cache d'extraction et des embeddings, par résultat")
+registry.describe("retries_total", "Reprises d'appels externes")
+registry.describe("validation_failures_total", "Extractions non conformes au schéma ou JSON illisible")
+registry.describe("llm_tokens_total", "Tokens facturés par l'API (prompt / completion)")
+
+# ─────────────────────────────
+# Server-Timing : durées par étape de la requête HTTP en cours
+# ─────────────────────────────
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def start_request() -> Tuple[Dict[str, float], Any]:
+    timings: Dict[str, float] = {}
+    return timings, _request_timings.set(timings)
+
+
+def end_request(token) -> None:
+    _request_timings.reset(token)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+
+
+# ─────────────────────────────
+# API d'instrumentation (no-op si metrics_enabled=False)
+# ─────────────────────────────
+class _Timer:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.stage, time.perf_counter() - self.t0)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def timed(stage: str):
+    """with timed("llm"): ...  → histogramme stage_seconds{stage} + entrée Server-Timing."""
+    return _Timer(stage) if ENABLED else _NOOP
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    if not ENABLED:
+        return
+    registry.histogram("stage_seconds", (("stage", stage),)).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:  # plusieurs appels (chunks) : durées cumulées
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    if ENABLED and value:
+        registry.counter(name, tuple(sorted(labels.items()))).inc(value)
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: str) -> None:
+    if ENABLED:
+        registry.histogram(name, tuple(sorted(labels.items())), buckets).observe(value)
@@ -0,0 +1,81 @@
+# Middlewares ASGI de l'application
+import time
+from typing import Dict
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from . import metrics
+
+
+class BodySizeLimitMiddleware:
+    """
+    Refuse (413) les corps de requête trop gros, au fil de la réception :
+    - immédiatement si l'en-tête Content-Length dépasse la limite ;
+    - sinon dès que les octets reçus la dépassent (upload chunked).
+    `limits` associe un chemin à sa taille maximale en octets (celle annoncée
+    dans le message d'erreur) ; `margins` ajoute, par chemin, une tolérance
+    interne pour l'enveloppe multipart autour du fichier.
+    """
+
+    def __init__(self, app, limits: Dict[str, int], margins: Dict[str, int] | None = None):
+        self.app = app
+        self.limits = limits
+        self.margins = margins or {}
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        max_bytes = self.limits.get(path) if scope["type"] == "http" else None
+        if max_bytes is None:
+            return await self.app(scope, receive, send)
+
+        limit = max_bytes + self.margins.get(path, 0)
+        detail = f"Fichier trop volumineux (max {max_bytes} octets)."
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # remonte jusqu'au handler d'exceptions de FastAPI → 413
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class ServerTimingMiddleware:
+    """
+    Ajoute l'en-tête Server-Timing (durées par étape + total, en ms) aux
+    réponses HTTP. Les étapes sont collectées par app.metrics.timed() via un
+    ContextVar propre à la requête (copié dans le threadpool de FastAPI).
+    Pour un flux (StreamingResponse), l'en-tête part avant le corps : seules
+    les étapes déjà terminées y figurent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.ENABLED:
+            return await self.app(scope, receive, send)
+
+        t0 = time.perf_counter()
+        timings, token = metrics.start_request()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings["total"] = (time.perf_counter() - t0) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing_header(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.end_request(token)
@@ -1,38 +1,144 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from ..schemas import ExtractRequest, ExtractResponse, ExtractFileResponse
-from ..services.extractor import process_text, extract_text_from_pdf
+import asyncio, io, json, time
+from typing import List, Literal
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..schemas import ExtractRequest, ExtractResponse, ExtractFileResponse, BatchItemResult
+from ..settings import settings
+from ..uploads import read_upload, upload_size
+from ..services.extractor import extract_text_from_pdf, process_text_stream, result_cache
+from ..services.long_document import extract_document_async
 
 router = APIRouter(prefix="", tags=["extract"])
 
 @router.post("/extract", response_model=ExtractResponse)
-def extract_from_text(req: ExtractRequest):
+async def extract_from_text(req: ExtractRequest):
     try:
-        data, valid, err = process_text(req.text)
-        return ExtractResponse(json=data, valid=valid, validation_error=err)
+        data, valid, err, stats = await extract_document_async(req.text, use_cache=req.use_cache,
+                                                               long_document=req.long_document,
+                                                               variant=req.prompt_variant)
+        return ExtractResponse(json=data, valid=valid, validation_error=err, stats=stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/extract-stream")
+async def extract_stream(req: ExtractRequest):
+    """
+    Server-Sent Events : `section` / `item` dès qu'une partie du JSON est
+    complète (patient, chaque consultations[i], ...), puis `result` avec
+    l'enregistrement validé, ou `error`. Toujours un seul appel au modèle
+    (pas de découpage map-reduce).
+    """
+    async def events():
+        try:
+            async for event in process_text_stream(req.text, use_cache=req.use_cache,
+                                                   variant=req.prompt_variant):
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/extract-file", response_model=ExtractFileResponse)
-def extract_from_file(file: UploadFile = File(...)):
+async def extract_from_file(file: UploadFile = File(...),
+                            use_cache: bool = Query(True, description="False pour ignorer le cache"),
+                            long_document: bool | None = Query(None, description="Découpage map-reduce (auto par défaut)"),
+                            prompt_variant: Literal["full", "compact", "condensed"] | None = Query(None, description="Forme du schéma dans le prompt (défaut : settings.prompt_variant)")):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Merci d'uploader un PDF.")
     try:
-        # Sauver temporairement puis extraire
-        content = file.file.read()
-        tmp_path = f"/tmp/{file.filename}"
-        with open(tmp_path, "wb") as f:
-            f.write(content)
+        # Pas de copie ni de fichier /tmp : pdfplumber lit directement le flux
+        # spoolé de l'upload (mémoire, ou fichier anonyme au-delà de 1 Mo).
+        size = await upload_size(file)
+        if size > settings.max_upload_bytes:
+            raise HTTPException(status_code=413, detail=f"Fichier trop volumineux (max {settings.max_upload_bytes} octets).")
 
-        text = extract_text_from_pdf(tmp_path)
-        data, valid, err = process_text(text)
+        # pdfplumber est bloquant (CPU) : on le sort de la boucle d'événements
+        text = await run_in_threadpool(extract_text_from_pdf, file.file)
+        data, valid, err, stats = await extract_document_async(text, use_cache=use_cache,
+                                                               long_document=long_document,
+                                                               variant=prompt_variant)
 
         return ExtractFileResponse(
             filename=file.filename,
-            size=len(content),
+            size=size,
             content_type=file.content_type or "application/pdf",
             json=data,
             valid=valid,
-            validation_error=err
+            validation_error=err,
+            stats=stats,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/extract-batch")
+async def extract_batch(texts: List[str] = Form(default=[]),
+                        files: List[UploadFile] = File(default=[]),
+                        parallel: int | None = Query(None, ge=1, description="Documents en parallèle (plafonné par la config)"),
+                        use_cache: bool = Query(True, description="False pour ignorer le cache")):
+    """
+    Traite plusieurs textes et/ou PDFs en parallèle (borné) et renvoie chaque
+    résultat en NDJSON dès qu'il est prêt (ordre d'achèvement, champ `index`
+    = position dans la requête). Une erreur sur un document n'arrête pas le lot.
+    """
+    items: list[tuple[str, str | bytes | Exception]] = [("text", t) for t in texts]
+    for f in files:
+        # lus maintenant : les uploads sont fermés une fois la réponse lancée ;
+        # un fichier trop gros devient une ligne en erreur, pas un échec du lot
+        try:
+            payload = await read_upload(f)
+        except HTTPException as e:
+            payload = ValueError(e.detail)
+        items.append((f.filename or "file.pdf", payload))
+    if not items:
+        raise HTTPException(status_code=400, detail="Aucun texte ni fichier fourni.")
+
+    limit = min(parallel or settings.batch_max_parallel, settings.batch_max_parallel)
+    return StreamingResponse(_stream_batch(items, limit, use_cache), media_type="application/x-ndjson")
+
+async def _stream_batch(items: list[tuple[str, str | bytes | Exception]], limit: int, use_cache: bool):
+    sem = asyncio.Semaphore(limit)
+
+    async def run(index: int, source: str, payload: str | bytes | Exception) -> BatchItemResult:
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                if isinstance(payload, Exception):
+                    raise payload
+                if isinstance(payload, bytes):
+                    text = await run_in_threadpool(extract_text_from_pdf, io.BytesIO(payload))
+                else:
+                    text = payload
+                data, valid, err, stats = await extract_document_async(text, use_cache=use_cache)
+                result = ExtractResponse(json=data, valid=valid, validation_error=err, stats=stats)
+                return BatchItemResult(index=index, source=source, ok=True, result=result,
+                                       duration_ms=(time.perf_counter() - t0) * 1000)
+            except Exception as e:
+                return BatchItemResult(index=index, source=source, ok=False, error=str(e),
+                                       duration_ms=(time.perf_counter() - t0) * 1000)
+
+    tasks = [asyncio.create_task(run(i, src, payload)) for i, (src, payload) in enumerate(items)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            item = await done
+            yield item.model_dump_json(by_alias=True) + "\n"
+    finally:
+        # client déconnecté : on n'exécute pas le reste du lot pour rien
+        for t in tasks:
+            t.cancel()
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    return result_cache.stats()
+
+@router.delete("/cache")
+def cache_clear():
+    result_cache.clear()
+    return {"cleared": True}
@@ -1,9 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from typing import Dict
-from ..services.passage_builder import json_to_passages
-from ..services.embeddings import embed_texts_mistral
-from ..services.vectors_qdrant import ensure_collection, upsert_passages
-import uuid  # <- importer uuid
+from ..services.indexing import index_document, index_records
+from ..schemas import IndexBatchRequest
 
 router = APIRouter(prefix="", tags=["index"])
 
@@ -11,22 +9,23 @@ router = APIRouter(prefix="", tags=["index"])
 def index_json(doc: Dict):
     """
     Reçoit un JSON médical (sortie de /extract), crée des passages,
-    embed via Mistral, et upsert dans Qdrant.
+    embed (backend settings.embed_backend), et upsert dans Qdrant.
+    doc_id stable (document_source ou contenu) : une ré-indexation n'embedde
+    que les passages nouveaux ou modifiés et supprime ceux qui ont disparu.
     """
     try:
-        # Générer un doc_id unique pour ce document
-        doc_id = f"doc_{uuid.uuid4().hex[:8]}"  # ex: doc_1a2b3c4d
-
-        passages = json_to_passages(doc)
-        texts = [t for t, _ in passages]
-        metas = [m for _, m in passages]
-        vectors = embed_texts_mistral(texts)
-
-        # Crée / ajuste la collection à la bonne dimension (auto)
-        ensure_collection(vector_size=len(vectors[0]))
-
-        n = upsert_passages(doc_id=doc_id, texts=texts, vectors=vectors, metas=metas, raw_json=doc)
-        return {"doc_id": doc_id, "inserted": n, "dimension": len(vectors[0])}
+        return index_document(doc)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/index-batch")
+def index_batch(req: IndexBatchRequest):
+    """
+    Indexation en masse : passages, embeddings et upserts Qdrant tournent en
+    pipeline (étapes concurrentes, lots). Renvoie les doc_id et le débit de
+    chaque étape.
+    """
+    try:
+        return index_records(req.records)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
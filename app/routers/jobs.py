@@ -0,0 +1,48 @@
+from typing import Literal
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from ..schemas import JobResponse
+from ..services.jobs import get_job_store, notify_job_workers
+from ..uploads import read_upload
+
+router = APIRouter(prefix="", tags=["jobs"])
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(file: UploadFile | None = File(None),
+                     text: str | None = Form(None),
+                     index: bool = Query(False, description="Indexer le dossier extrait dans Qdrant"),
+                     use_cache: bool = Query(True, description="False pour ignorer le cache"),
+                     long_document: bool | None = Query(None, description="Découpage map-reduce (auto par défaut)"),
+                     prompt_variant: Literal["full", "compact", "condensed"] | None = Query(None, description="Forme du schéma dans le prompt (défaut : settings.prompt_variant)")):
+    """
+    Mode asynchrone pour les gros documents : renvoie tout de suite l'id du
+    job (file persistante), à suivre avec GET /jobs/{id}. Une soumission
+    identique (même contenu, mêmes options) renvoie le job existant.
+    """
+    if (file is None) == (text is None):
+        raise HTTPException(status_code=400, detail="Fournir soit un PDF (file), soit un texte (text).")
+    if file is not None and not (file.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Merci d'uploader un PDF.")
+    if text is not None and not text.strip():
+        raise HTTPException(status_code=400, detail="Texte vide.")
+    try:
+        if file is not None:
+            payload, kind, source = await read_upload(file), "pdf", file.filename
+        else:
+            payload, kind, source = text.encode("utf-8"), "text", "text"
+        options = {"index": index, "use_cache": use_cache, "long_document": long_document,
+                   "prompt_variant": prompt_variant}
+        job, deduplicated = await run_in_threadpool(get_job_store().submit, payload, kind, source, options)
+        notify_job_workers()
+        return JobResponse(**job, deduplicated=deduplicated)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = await run_in_threadpool(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job inconnu : {job_id}")
+    return JobResponse(**job)
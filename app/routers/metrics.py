@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..metrics import registry
+
+router = APIRouter(prefix="", tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Histogrammes par étape (pdf, prompt, llm, json, validate, passages,
+    embeddings, upsert), compteurs (cache, reprises, échecs de validation,
+    tokens) et file de génération locale, au format texte Prometheus.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
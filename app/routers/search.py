@@ -0,0 +1,31 @@
+import time
+from typing import List
+from fastapi import APIRouter, HTTPException
+from ..schemas import SearchQuery, SearchBatchRequest, SearchResponse
+from ..services.search import search, search_batch
+
+router = APIRouter(prefix="", tags=["search"])
+
+@router.post("/search", response_model=SearchResponse)
+def search_passages(req: SearchQuery):
+    """
+    Recherche sémantique dans les passages indexés, filtrable par doc_id,
+    section et patient_nom. hydrate=True joint le dossier complet à chaque résultat.
+    """
+    try:
+        t0 = time.perf_counter()
+        hits = search(req.model_dump())
+        return SearchResponse(query=req.query, hits=hits, took_ms=round((time.perf_counter() - t0) * 1000, 1))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/search-batch", response_model=List[SearchResponse])
+def search_passages_batch(req: SearchBatchRequest):
+    """Plusieurs requêtes : un seul appel d'embedding et un seul search_batch Qdrant."""
+    try:
+        t0 = time.perf_counter()
+        results = search_batch([q.model_dump() for q in req.queries])
+        took_ms = round((time.perf_counter() - t0) * 1000, 1)
+        return [SearchResponse(query=q.query, hits=hits, took_ms=took_ms) for q, hits in zip(req.queries, results)]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,162 @@
+# Micro-batching des générations locales : file d'attente devant ModelWrapper
+import asyncio, logging, queue, threading, time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from .metrics import registry
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ("text", "future", "enqueued")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class BatchScheduler:
+    """
+    Les requêtes concurrentes sont mises en file ; un thread unique forme des
+    lots : dès qu'une requête arrive, il attend au plus `max_wait_ms` (ou
+    jusqu'à `max_batch` requêtes), appelle `generate_batch` une seule fois
+    puis rend chaque sortie décodée à son appelant (Future).
+    """
+
+    def __init__(self, generate_batch: Callable[[List[str]], List[str]],
+                 max_batch: int = 8, max_wait_ms: float = 20.0):
+        self.generate_batch = generate_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # séries partagées avec /metrics
+        self.batch_size = registry.histogram("gen_batch_size", buckets=[1, 2, 4, 8, 16, 32, 64])
+        self.queue_wait_ms = registry.histogram("gen_queue_wait_ms", buckets=[1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 5000])
+        self.batches = 0
+        self.requests = 0
+
+    # ── API ──────────────────────────────────
+    def submit(self, text: str) -> Future:
+        req = _Request(text)
+        with self._lock:
+            if self._thread is None:
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._loop, args=(self._queue, self._stop),
+                                                name="gen-batcher", daemon=True)
+                self._thread.start()
+            self._queue.put(req)
+        return req.future
+
+    def generate(self, text: str) -> str:
+        return self.submit(text).result()
+
+    async def generate_async(self, text: str) -> str:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+    def close(self) -> None:
+        """
+        Termine le lot en cours puis arrête le thread ; les requêtes encore en
+        file échouent (RuntimeError) au lieu d'attendre indéfiniment. Un submit()
+        ultérieur repart sur une file et un thread neufs.
+        """
+        with self._lock:
+            thread, q, stop = self._thread, self._queue, self._stop
+            if thread is None:
+                return
+            self._thread, self._queue = None, queue.Queue()
+        stop.set()
+        q.put(None)  # réveille le thread s'il attend une requête
+        thread.join()
+        while True:
+            try:
+                req = q.get_nowait()
+            except queue.Empty:
+                return
+            if req is not None and req.future.set_running_or_notify_cancel():
+                req.future.set_exception(RuntimeError("Planificateur de génération arrêté avant traitement de la requête"))
+
+    # ── boucle ───────────────────────────────
+    def _collect(self, q: queue.Queue, first: _Request) -> List[_Request]:
+        batch, deadline = [first], first.enqueued + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                req = q.get(timeout=remaining) if remaining > 0 else q.get_nowait()
+            except queue.Empty:
+                break
+            if req is None:  # close() : on traite ce qui est déjà collecté
+                break
+            batch.append(req)
+        return batch
+
+    def _loop(self, q: queue.Queue, stop: threading.Event) -> None:
+        while not stop.is_set():
+            first = q.get()
+            if first is None:
+                return
+            batch = self._collect(q, first)
+            # requêtes annulées entre-temps (timeout, client déconnecté) : écartées ;
+            # les autres passent en RUNNING et ne peuvent plus être annulées
+            batch = [req for req in batch if req.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._run(batch)
+            except BaseException as e:  # la boucle doit survivre : sinon tous les appels suivants bloquent
+                logger.exception("gen-batcher : lot de %d requête(s) en échec", len(batch))
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+
+    def _run(self, batch: List[_Request]) -> None:
+        start = time.perf_counter()
+        for req in batch:
+            self.queue_wait_ms.observe((start - req.enqueued) * 1000)
+        self.batch_size.observe(len(batch))
+        self.batches += 1
+        self.requests += len(batch)
+        outputs = self.generate_batch([r.text for r in batch])
+        if len(outputs) != len(batch):
+            raise RuntimeError(f"generate_batch : {len(outputs)} sorties pour {len(batch)} textes")
+        for req, out in zip(batch, outputs):
+            if not req.future.done():
+                req.future.set_result(out)
+
+
+# singleton devant get_model() (modèle chargé au premier lot)
+_scheduler: Optional[BatchScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> BatchScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            from .infer import get_model
+
+            _scheduler = BatchScheduler(
+                lambda texts: get_model().generate_batch(texts),
+                max_batch=settings.gen_batch_max_size,
+                max_wait_ms=settings.gen_batch_wait_ms,
+            )
+        return _scheduler
+
+def close_scheduler() -> None:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.close()
+        _scheduler = None
@@ -1,9 +1,16 @@
 # app/schemas.py
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal
 
 class ExtractRequest(BaseModel):
     text: str = Field(..., description="Texte brut extrait du PDF/OCR")
+    use_cache: bool = Field(True, description="False pour forcer un nouvel appel au modèle")
+    long_document: Optional[bool] = Field(
+        None, description="Découpage map-reduce : None = automatique selon la longueur"
+    )
+    prompt_variant: Optional[Literal["full", "compact", "condensed"]] = Field(
+        None, description="Forme du schéma dans le prompt (défaut : settings.prompt_variant)"
+    )
 
 class ExtractFileResponse(BaseModel):
     filename: str
@@ -13,6 +20,8 @@ class ExtractFileResponse(BaseModel):
     json_: Dict[str, Any] = Field(..., alias="json")
     valid: bool = True
     validation_error: Optional[str] = None
+    # cache, variante de prompt, tokens (prompt/complétion), latence LLM
+    stats: Optional[Dict[str, Any]] = None
 
     # Permet de construire le modèle en passant soit json soit json_
     model_config = {
@@ -23,7 +32,61 @@ class ExtractResponse(BaseModel):
     json_: Dict[str, Any] = Field(..., alias="json")
     valid: bool = True
     validation_error: Optional[str] = None
+    stats: Optional[Dict[str, Any]] = None
 
     model_config = {
         "populate_by_name": True
     }
+
+class BatchItemResult(BaseModel):
+    """Une ligne NDJSON du flux /extract-batch."""
+    index: int
+    source: str  # "text" ou nom du fichier PDF
+    ok: bool
+    result: Optional[ExtractResponse] = None
+    error: Optional[str] = None
+    duration_ms: float
+
+class JobResponse(BaseModel):
+    """Statut d'un job (/jobs) ; `result` une fois le job terminé."""
+    id: str
+    status: Literal["queued", "running", "done", "failed"]
+    source: str  # "text" ou nom du fichier PDF
+    deduplicated: bool = False  # soumission identique à un job existant
+    attempts: int = 0
+    max_attempts: int
+    error: Optional[str] = None  # dernière erreur (y compris avant une reprise)
+    # {"json", "valid", "validation_error", "stats", "index"}
+    result: Optional[Dict[str, Any]] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class IndexBatchRequest(BaseModel):
+    records: List[Dict[str, Any]] = Field(..., description="Dossiers extraits (champ json de /extract)")
+
+class SearchQuery(BaseModel):
+    query: str = Field(..., min_length=1, description="Question en langage naturel")
+    top_k: int = Field(5, ge=1, le=100)
+    doc_id: Optional[str] = None
+    section: Optional[str] = Field(None, description="patient | antecedent | maladie | traitement | consultation")
+    patient_nom: Optional[str] = None
+    hydrate: bool = Field(False, description="Joindre le dossier complet (record) à chaque résultat")
+
+class SearchBatchRequest(BaseModel):
+    queries: List[SearchQuery] = Field(..., min_length=1)
+
+class SearchHit(BaseModel):
+    id: Any
+    score: float
+    doc_id: Optional[str] = None
+    section: Optional[str] = None
+    patient_nom: Optional[str] = None
+    text: Optional[str] = None
+    meta: Optional[Dict[str, Any]] = None
+    record: Optional[Dict[str, Any]] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: List[SearchHit]
+    took_ms: Optional[float] = None
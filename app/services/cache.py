@@ -0,0 +1,172 @@
+# Cache des résultats : LRU mémoire + stockage JSON sur disque
+import json, os, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class LRUCache:
+    """
+    Cache mémoire LRU, thread-safe, avec expiration optionnelle (TTL en secondes).
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float | None = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds or None
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            created, value = item
+            if self.ttl_seconds and time.time() - created > self.ttl_seconds:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, created: float | None = None) -> None:
+        with self._lock:
+            self._data[key] = (created or time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResultCache:
+    """
+    Cache à deux niveaux :
+    1) LRU mémoire (réponse en microsecondes)
+    2) un fichier JSON par clé sous `directory` (survit aux redémarrages)
+
+    Les entrées expirent après `ttl_seconds` (0/None = jamais) ; le disque est
+    élagué (plus anciens fichiers d'abord) au-delà de `max_disk_entries`.
+    """
+
+    def __init__(self, directory: str | Path, max_entries: int = 512,
+                 max_disk_entries: int = 10000, ttl_seconds: float | None = None):
+        self.directory = Path(directory)
+        self.max_disk_entries = max(1, int(max_disk_entries))
+        self.ttl_seconds = ttl_seconds or None
+        self.memory = LRUCache(max_entries=max_entries, ttl_seconds=self.ttl_seconds)
+        self._lock = threading.Lock()
+        self._disk_count: Optional[int] = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+    # ── chemins ──────────────────────────────
+    def _path(self, key: str) -> Path:
+        # sous-dossier sur 2 caractères pour éviter des dossiers géants
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _expired(self, created: float) -> bool:
+        return bool(self.ttl_seconds) and time.time() - created > self.ttl_seconds
+
+    # ── API ──────────────────────────────────
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        # la mémoire garde le JSON sérialisé : chaque appelant reçoit son propre
+        # objet et ne peut pas modifier l'entrée en cache
+        payload = self.memory.get(key)
+        if payload is not None:
+            self._count("hits_memory")
+            return json.loads(payload)
+
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+
+        created = float(entry.get("created", 0))
+        if self._expired(created):
+            path.unlink(missing_ok=True)
+            self._count("misses")
+            return None
+
+        value = entry.get("value")
+        self.memory.set(key, json.dumps(value, ensure_ascii=False), created=created)
+        self._count("hits_disk")
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        created = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        self.memory.set(key, payload, created=created)
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not path.exists()
+        # écriture atomique : fichier temporaire puis rename
+        tmp = path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(f'{{"created": {json.dumps(created)}, "value": {payload}}}', encoding="utf-8")
+        os.replace(tmp, path)
+
+        if is_new:
+            with self._lock:
+                self._disk_count = self._count_disk() if self._disk_count is None else self._disk_count + 1
+                if self._disk_count > self.max_disk_entries:
+                    self._prune_disk()
+
+    def clear(self) -> None:
+        self.memory.clear()
+        with self._lock:
+            for f in self.directory.glob("*/*.json"):
+                f.unlink(missing_ok=True)
+            self._disk_count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits_memory, hits_disk, misses = self.hits_memory, self.hits_disk, self.misses
+        lookups = hits_memory + hits_disk + misses
+        return {
+            "hits_memory": hits_memory,
+            "hits_disk": hits_disk,
+            "misses": misses,
+            "hit_ratio": round((hits_memory + hits_disk) / lookups, 4) if lookups else None,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+            "disk_entries": self._disk_count,
+            "disk_evictions": self.disk_evictions,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+    def _count(self, counter: str) -> None:
+        # += n'est pas atomique : des get() concurrents perdraient des incréments
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    # ── élagage disque ───────────────────────
+    def _count_disk(self) -> int:
+        return sum(1 for _ in self.directory.glob("*/*.json"))
+
+    def _prune_disk(self) -> None:
+        # on retire ~10 % de marge pour ne pas élaguer à chaque écriture
+        files = sorted(self.directory.glob("*/*.json"), key=_mtime)
+        target = int(self.max_disk_entries * 0.9)
+        surplus = max(0, len(files) - target)
+        for f in files[:surplus]:
+            f.unlink(missing_ok=True)
+        self.disk_evictions += surplus
+        self._disk_count = len(files) - surplus
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
@@ -0,0 +1,54 @@
+# Stockage des dossiers médicaux complets, une seule fois par document (hors Qdrant)
+import json, os, re, threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from ..settings import settings
+from .cache import LRUCache
+
+
+class DocumentStore:
+    """
+    Un fichier JSON par document : `directory/<doc_id>.json`.
+    Les points Qdrant ne portent que le doc_id ; le dossier complet est relu ici
+    à la demande (LRU mémoire devant le disque). Écritures atomiques.
+    """
+
+    def __init__(self, directory: str | Path, max_cached: int = 256):
+        self.directory = Path(directory)  # créé au premier enregistrement
+        self.memory = LRUCache(max_entries=max_cached)
+
+    def _path(self, doc_id: str) -> Path:
+        return self.directory / (re.sub(r"[^\w.-]", "_", doc_id) + ".json")
+
+    def save(self, doc_id: str, record: Dict) -> None:
+        path = self._path(doc_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        self.memory.set(doc_id, record)
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        record = self.memory.get(doc_id)
+        if record is None:
+            try:
+                record = json.loads(self._path(doc_id).read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                return None
+            self.memory.set(doc_id, record)
+        return record
+
+    def get_many(self, doc_ids: Iterable[str]) -> Dict[str, Dict]:
+        out: Dict[str, Dict] = {}
+        for doc_id in dict.fromkeys(doc_ids):
+            record = self.get(doc_id)
+            if record is not None:
+                out[doc_id] = record
+        return out
+
+    def delete(self, doc_id: str) -> None:
+        self._path(doc_id).unlink(missing_ok=True)
+        self.memory.set(doc_id, None)
+
+
+document_store = DocumentStore(Path(settings.outputs_dir) / "documents")
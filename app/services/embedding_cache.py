@@ -0,0 +1,139 @@
+# Cache disque des embeddings : vecteurs float32 bruts (memmap) + index de clés binaires
+import fcntl, hashlib, json, re, threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+KEY_BYTES = 16
+
+
+class EmbeddingCache:
+    """
+    Un dossier par modèle d'embedding :
+    - keys.bin    : clés de 16 octets (blake2b(modèle, texte)), une par vecteur
+    - vectors.f32 : vecteurs float32 bruts dans le même ordre, lus via np.memmap
+    - meta.json   : {"model", "dim"}
+    Les deux fichiers sont en ajout seul ; un verrou fcntl protège les écritures
+    de plusieurs workers, qui relisent la fin de l'index quand il a grandi.
+    """
+
+    def __init__(self, directory: str | Path, model: str):
+        self.model = model
+        self.dir = Path(directory) / re.sub(r"[^\w.-]", "_", model)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.keys_path = self.dir / "keys.bin"
+        self.vectors_path = self.dir / "vectors.f32"
+        self.meta_path = self.dir / "meta.json"
+        self.lock_path = self.dir / ".lock"
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._file_lock():
+            self._load()
+
+    # ── clés / fichiers ──────────────────────
+    def key(self, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=KEY_BYTES)
+        h.update(self.model.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.digest()
+
+    def _file_lock(self):
+        return _FileLock(self.lock_path)
+
+    def _load(self) -> None:
+        if self.dim is None and self.meta_path.exists():
+            self.dim = int(json.loads(self.meta_path.read_text(encoding="utf-8"))["dim"])
+        if self.dim is None:
+            return
+        keys_size = self.keys_path.stat().st_size if self.keys_path.exists() else 0
+        vecs_size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        n = min(keys_size // KEY_BYTES, vecs_size // (4 * self.dim))
+        if keys_size != n * KEY_BYTES or vecs_size != n * 4 * self.dim:
+            # écriture interrompue : on revient au dernier couple clé/vecteur complet
+            # ("a+b" : l'un des deux fichiers peut manquer après un crash au 1er put_many)
+            with open(self.keys_path, "a+b") as f:
+                f.truncate(n * KEY_BYTES)
+            with open(self.vectors_path, "a+b") as f:
+                f.truncate(n * 4 * self.dim)
+        known = len(self._index)
+        if n > known:
+            with open(self.keys_path, "rb") as f:
+                f.seek(known * KEY_BYTES)
+                raw = f.read((n - known) * KEY_BYTES)
+            for i in range(n - known):
+                self._index[raw[i * KEY_BYTES:(i + 1) * KEY_BYTES]] = known + i
+        if n and (self._vectors is None or self._vectors.shape[0] != n):
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _refresh(self) -> None:
+        # un autre worker a pu ajouter des vecteurs depuis le dernier chargement
+        if self.dim is None or not self.keys_path.exists() \
+                or self.keys_path.stat().st_size // KEY_BYTES != len(self._index):
+            with self._file_lock():
+                self._load()
+
+    # ── API ──────────────────────────────────
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        with self._lock:
+            self._refresh()
+            out: List[Optional[List[float]]] = []
+            for t in texts:
+                row = self._index.get(self.key(t))
+                out.append(None if row is None else self._vectors[row].tolist())
+            found = sum(v is not None for v in out)
+            self.hits += found
+            self.misses += len(out) - found
+            return out
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        arr = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._load()
+            if self.dim is None:
+                self.dim = int(arr.shape[1])
+                self.meta_path.write_text(json.dumps({"model": self.model, "dim": self.dim}), encoding="utf-8")
+            elif arr.shape[1] != self.dim:
+                raise RuntimeError(f"Dimension d'embedding {arr.shape[1]} ≠ {self.dim} en cache pour {self.model}")
+
+            # clé → ligne de `vectors` (dict : doublons du lot écartés en O(1), ordre conservé)
+            new: Dict[bytes, int] = {}
+            for i, t in enumerate(texts):
+                k = self.key(t)
+                if k not in self._index and k not in new:
+                    new[k] = i
+            if not new:
+                return
+            # vecteurs d'abord : une clé n'est jamais écrite sans son vecteur
+            with open(self.vectors_path, "ab") as f:
+                f.write(arr[list(new.values())].tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new))
+            self._load()
+
+    def stats(self) -> Dict[str, object]:
+        return {"model": self.model, "dim": self.dim, "entries": len(self._index),
+                "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class _FileLock:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self):
+        self.f = open(self.path, "a+b")
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
@@ -1,23 +1,280 @@
-import os, requests
-from typing import List
+import random, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from ..metrics import inc, timed
 from ..settings import settings
+from .embedding_cache import EmbeddingCache
+from .prompts import estimate_tokens
 
-MISTRAL_API_KEY = settings.mistral_api_key
-EMBED_MODEL = os.getenv("MISTRAL_EMBED_MODEL", "mistral-embed")
-EMBED_URL = "https://api.mistral.ai/v1/embeddings"
-
-def embed_texts_mistral(texts: List[str]) -> List[list]:
-    """
-    Appelle l'API Mistral Embeddings et retourne une liste de vecteurs.
-    """
-    if not MISTRAL_API_KEY:
-        raise RuntimeError("MISTRAL_API_KEY manquante")
-    headers = {"Authorization": f"Bearer {MISTRAL_API_KEY}", "Content-Type": "application/json"}
-    payload = {"model": EMBED_MODEL, "input": texts}
-    r = requests.post(EMBED_URL, headers=headers, json=payload, timeout=60)
-    if r.status_code != 200:
-        raise RuntimeError(f"Mistral embeddings error {r.status_code}: {r.text}")
-    data = r.json()["data"]
-    # data est une liste d'objets {"object":"embedding","embedding":[...],"index":i}
-    embs = [d["embedding"] for d in data]
-    return embs
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# ─────────────────────────────
+# Client HTTP : session partagée, lots, parallélisme, reprises
+# ─────────────────────────────
+class EmbeddingsClient:
+    """
+    Client de l'API Embeddings (format Mistral / OpenAI) :
+    - une requests.Session avec un pool keep-alive de `max_parallel` connexions ;
+    - découpage en lots bornés en nombre de textes et en tokens estimés ;
+    - lots envoyés en parallèle, vecteurs réassemblés dans l'ordre d'entrée ;
+    - reprise des 429 / 5xx / erreurs réseau avec backoff exponentiel à gigue
+      complète, en respectant Retry-After quand il est fourni.
+    `url` peut pointer vers un serveur local de substitution (tests, bench).
+    """
+
+    def __init__(self, url: str, api_key: Optional[str], model: str, *,
+                 batch_size: int = 64, batch_max_tokens: int = 8000, max_parallel: int = 4,
+                 max_retries: int = 5, timeout_s: float = 60.0,
+                 backoff_base_s: float = 0.5, backoff_max_s: float = 20.0):
+        self.url, self.model = url, model
+        self.batch_size, self.batch_max_tokens = max(1, batch_size), batch_max_tokens
+        self.max_retries, self.timeout_s = max_retries, timeout_s
+        self.backoff_base_s, self.backoff_max_s = backoff_base_s, backoff_max_s
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_parallel))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "application/json"
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self._pool = ThreadPoolExecutor(max(1, max_parallel), thread_name_prefix="embed")
+        self.requests_sent = 0
+        self.retries = 0
+
+    def batches(self, texts: Sequence[str]) -> List[Tuple[int, int]]:
+        """Intervalles [début, fin) consécutifs ; un texte trop long forme son propre lot."""
+        spans: List[Tuple[int, int]] = []
+        start, tokens = 0, 0
+        for i, t in enumerate(texts):
+            n = estimate_tokens(t)
+            if i > start and (i - start >= self.batch_size or tokens + n > self.batch_max_tokens):
+                spans.append((start, i))
+                start, tokens = i, 0
+            tokens += n
+        if start < len(texts):
+            spans.append((start, len(texts)))
+        return spans
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_max_s, max(0.0, float(retry_after)))
+            except ValueError:
+                try:
+                    wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(self.backoff_max_s, max(0.0, wait))
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+
+    def _post(self, texts: Sequence[str]) -> List[list]:
+        payload = {"model": self.model, "input": list(texts)}
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                self.requests_sent += 1
+                r = self.session.post(self.url, json=payload, timeout=self.timeout_s)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = f"Mistral embeddings error réseau: {e}"
+            else:
+                if r.status_code == 200:
+                    data = r.json()["data"]
+                    if len(data) != len(texts):
+                        raise RuntimeError(f"Mistral embeddings: {len(data)} vecteurs reçus pour {len(texts)} textes")
+                    # data est une liste d'objets {"object":"embedding","embedding":[...],"index":i}
+                    return [d["embedding"] for d in sorted(data, key=lambda d: d["index"])]
+                error = f"Mistral embeddings error {r.status_code}: {r.text}"
+                if r.status_code not in RETRY_STATUS:
+                    raise RuntimeError(error)
+                retry_after = r.headers.get("Retry-After")
+            if attempt < self.max_retries:
+                self.retries += 1
+                inc("retries_total", target="embeddings")
+                time.sleep(self._delay(attempt, retry_after))
+        raise RuntimeError(f"{error} (après {self.max_retries} reprises)")
+
+    def embed(self, texts: Sequence[str]) -> List[list]:
+        spans = self.batches(texts)
+        if len(spans) <= 1:
+            return self._post(texts) if texts else []
+        futures = [self._pool.submit(self._post, texts[a:b]) for a, b in spans]
+        out: List[list] = []
+        try:
+            for f in futures:
+                out.extend(f.result())
+        except Exception:
+            for f in futures:
+                f.cancel()
+            raise
+        return out
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+# ─────────────────────────────
+# Backends : Mistral (HTTP) ou local (n-grammes de caractères hachés)
+# ─────────────────────────────
+class EmbeddingBackend:
+    """
+    Interface commune. `name` et `model` identifient l'espace vectoriel : ils
+    sont écrits dans chaque point Qdrant et déterminent la collection et le
+    dossier du cache disque, pour ne jamais mélanger deux backends.
+    """
+    name: str = ""
+    model: str = ""
+    dim: Optional[int] = None  # None = connue après le premier appel
+    cacheable: bool = True     # vaut-il la peine de passer par le cache disque ?
+
+    def embed(self, texts: Sequence[str]) -> List[list]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MistralEmbeddingBackend(EmbeddingBackend):
+    name = "mistral"
+
+    def __init__(self):
+        self.model = settings.mistral_embed_model
+        self._client: Optional[EmbeddingsClient] = None
+        self._lock = threading.Lock()
+
+    def client(self) -> EmbeddingsClient:
+        with self._lock:
+            if self._client is None:
+                if not settings.mistral_api_key:
+                    raise RuntimeError("MISTRAL_API_KEY manquante")
+                self._client = EmbeddingsClient(
+                    settings.mistral_embed_url, settings.mistral_api_key, self.model,
+                    batch_size=settings.embed_batch_size,
+                    batch_max_tokens=settings.embed_batch_max_tokens,
+                    max_parallel=settings.embed_max_parallel,
+                    max_retries=settings.embed_max_retries,
+                    timeout_s=settings.embed_timeout_s,
+                )
+            return self._client
+
+    def embed(self, texts: Sequence[str]) -> List[list]:
+        return self.client().embed(texts)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Embedder hors ligne, déterministe : n-grammes de caractères (3 à 5) du
+    texte en minuscules, hachés (hash polynomial + mélange, indépendant de
+    PYTHONHASHSEED) dans `dim` cases signées, puis normalisation L2.
+    Tout le lot est traité en NumPy vectorisé. Qualité bien inférieure à
+    Mistral : destiné aux tests et au mode dégradé.
+    """
+    name = "local"
+    cacheable = False  # recalculer coûte moins cher que relire le cache
+    NGRAMS = (3, 4, 5)
+    _PRIME = np.uint64(1_000_003)
+    _MIX = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, dim: int = 512):
+        self.dim = int(dim)
+        self.model = f"hash-ngram-{'-'.join(map(str, self.NGRAMS))}-d{self.dim}"
+
+    def embed(self, texts: Sequence[str]) -> List[list]:
+        if not texts:
+            return []
+        # points de code de tous les textes bout à bout, avec le n° de ligne de chacun
+        padded = [f" {t.lower()} " for t in texts]
+        codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        rows = np.repeat(np.arange(len(texts)), [len(t) for t in padded])
+        slots, signs = [], []
+        for n in self.NGRAMS:
+            if len(codes) < n:
+                continue
+            h = np.zeros(len(codes) - n + 1, dtype=np.uint64)
+            for k in range(n):  # hash polynomial des fenêtres (débordement modulo 2^64)
+                h = h * self._PRIME + codes[k:len(codes) - n + 1 + k]
+            h ^= h >> np.uint64(29)
+            h *= self._MIX
+            h ^= h >> np.uint64(32)
+            keep = rows[: len(h)] == rows[n - 1:]  # fenêtres à cheval sur deux textes exclues
+            h = h[keep]
+            slots.append(rows[: len(keep)][keep] * self.dim + (h % np.uint64(self.dim)).astype(np.int64))
+            signs.append(np.where(h >> np.uint64(63), -1.0, 1.0))
+        counts = np.bincount(np.concatenate(slots), weights=np.concatenate(signs),
+                             minlength=len(texts) * self.dim) if slots else np.zeros(len(texts) * self.dim)
+        vecs = counts.reshape(len(texts), self.dim)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs /= np.where(norms == 0, 1.0, norms)
+        return vecs.astype(np.float32).tolist()
+
+
+BACKENDS = {"mistral": MistralEmbeddingBackend, "local": LocalEmbeddingBackend}
+
+_backend: Optional[EmbeddingBackend] = None
+_caches: Dict[str, EmbeddingCache] = {}
+_backend_lock = threading.Lock()
+
+def get_backend() -> EmbeddingBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = settings.embed_backend
+            if name not in BACKENDS:
+                raise ValueError(f"embed_backend inconnu : {name!r} (attendu : {', '.join(BACKENDS)})")
+            _backend = LocalEmbeddingBackend(settings.local_embed_dim) if name == "local" else BACKENDS[name]()
+        return _backend
+
+def _cache_for(backend: EmbeddingBackend) -> Optional[EmbeddingCache]:
+    if not (settings.embed_cache_enabled and backend.cacheable):
+        return None
+    with _backend_lock:
+        if backend.model not in _caches:
+            _caches[backend.model] = EmbeddingCache(Path(settings.outputs_dir) / "embeddings_cache", backend.model)
+        return _caches[backend.model]
+
+def close_embeddings_client() -> None:
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = None
+
+# ─────────────────────────────
+# API du module
+# ─────────────────────────────
+def embed_texts(texts: List[str]) -> List[list]:
+    """
+    Retourne un vecteur par texte, dans l'ordre d'entrée, avec le backend
+    choisi par settings.embed_backend. Les textes identiques ne sont calculés
+    qu'une fois et, pour Mistral, seuls ceux absents du cache disque partent à l'API.
+    """
+    backend = get_backend()
+    cache = _cache_for(backend)
+    with timed("embeddings"):
+        unique = list(dict.fromkeys(texts))
+        cached = cache.get_many(unique) if cache is not None else [None] * len(unique)
+        vectors: Dict[str, list] = {t: v for t, v in zip(unique, cached) if v is not None}
+
+        missing = [t for t in unique if t not in vectors]
+        if cache is not None:
+            inc("cache_requests_total", len(vectors), cache="embeddings", result="hit")
+            inc("cache_requests_total", len(missing), cache="embeddings", result="miss")
+        if missing:
+            fresh = backend.embed(missing)
+            if cache is not None:
+                cache.put_many(missing, fresh)
+            vectors.update(zip(missing, fresh))
+        return [vectors[t] for t in texts]
+
+# ancien nom, conservé pour les scripts existants
+embed_texts_mistral = embed_texts
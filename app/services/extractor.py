@@ -1,129 +1,322 @@
-import os, json, re
-from datetime import datetime
+import json, hashlib, asyncio, time
+from functools import lru_cache
 from pathlib import Path
-import pdfplumber
-from jsonschema import validate, ValidationError
-from mistralai import Mistral
+from typing import TYPE_CHECKING, AsyncIterator, Dict
+import httpx
+from jsonschema import Draft7Validator, FormatChecker
+from ..metrics import inc, record_stage, timed
+from ..scheduler import get_scheduler
 from ..settings import settings
+from .cache import ResultCache
+from .prompts import PROMPT_VARIANTS, compile_prompts, estimate_tokens
+from .pdf_text import extract_text_from_pdf, iter_pdf_pages  # extraction PDF (ré-exportée)
+from .json_extract import extract_json  # scanner JSON linéaire (ré-exporté)
+from .stream_parser import SectionStreamParser, record_events
+
+if TYPE_CHECKING:
+    from mistralai import Mistral
 
 # ─────────────────────────────
-# Chargement du schéma
+# Chargement du schéma (à la première utilisation ou au warmup)
 # ─────────────────────────────
-SCHEMA = json.loads(Path(settings.schema_path).read_text(encoding="utf-8"))
+@lru_cache(maxsize=1)
+def get_schema() -> Dict:
+    return json.loads(Path(settings.schema_path).read_text(encoding="utf-8"))
+
+@lru_cache(maxsize=1)
+def get_validator() -> Draft7Validator:
+    # Validateur compilé une seule fois (schéma vérifié + format "date" contrôlé)
+    schema = get_schema()
+    Draft7Validator.check_schema(schema)
+    return Draft7Validator(schema, format_checker=FormatChecker(formats=("date",)))
+
+@lru_cache(maxsize=1)
+def schema_fingerprint() -> str:
+    return hashlib.sha256(
+        json.dumps(get_schema(), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+def __getattr__(name: str):
+    # compatibilité : extractor.SCHEMA / VALIDATOR / PROMPTS restent accessibles, sans coût à l'import
+    lazy = {"SCHEMA": get_schema, "VALIDATOR": get_validator,
+            "SCHEMA_FINGERPRINT": schema_fingerprint, "PROMPTS": get_prompts}
+    if name in lazy:
+        return lazy[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ─────────────────────────────
-# Extraction texte PDF
+# Cache des résultats
 # ─────────────────────────────
-def extract_text_from_pdf(file_path: str) -> str:
-    chunks = []
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            t = page.extract_text() or ""
-            chunks.append(t)
-    return "\n".join(chunks).strip()
+result_cache = ResultCache(
+    directory=Path(settings.outputs_dir) / "cache",
+    max_entries=settings.cache_max_entries,
+    max_disk_entries=settings.cache_max_disk_entries,
+    ttl_seconds=settings.cache_ttl_seconds,
+)
+
+def cache_key(text: str, variant: str | None = None) -> str:
+    """
+    Clé de cache = hash(texte, modèle, température, empreinte du schéma, variante de prompt).
+    """
+    h = hashlib.sha256()
+    model = settings.model_name if _local() else settings.mistral_model_name
+    for part in (model, repr(settings.temperature), schema_fingerprint(),
+                 variant or settings.prompt_variant, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
 
 # ─────────────────────────────
 # Prompt builder
 # ─────────────────────────────
-def build_prompt(text: str) -> str:
-    today = datetime.now().strftime("%Y-%m-%d")
-    return f"""
-Tu es un extracteur clinique. À partir du texte source, produis STRICTEMENT un JSON conforme au schéma.
-
-Règles strictes :
-- Sortie = JSON UNIQUEMENT (aucun commentaire, aucune prose).
-- N’utilise que les caractères JSON : {{ }} [ ] , : " .
-- Dates au format YYYY-MM-DD ; si inconnu -> null (si mois/jour inconnus → 01 par défaut).
-- N'invente rien ; si absent → null ou [].
-- Respecte toutes les clés/type du schéma.
-
-Schéma JSON :
-{json.dumps(SCHEMA, ensure_ascii=False, indent=2)}
-
-Contraintes meta :
-- meta.langue = "fr"
-- meta.date_extraction = "{today}"
-- meta.modele_utilise = "{settings.mistral_model_name}"
-- meta.schema_version = "1.0"
-
-Texte source :
-<<<
-{text}
->>>
-
-⚠️ IMPORTANT :
-- Un seul objet JSON valide, commençant par '{{' et finissant par '}}'.
-- AUCUN TEXTE hors JSON.
-"""
+# Partie statique (règles + schéma sérialisé) précalculée une fois (premier appel ou warmup)
+@lru_cache(maxsize=1)
+def get_prompts():
+    return compile_prompts(get_schema(), settings.mistral_model_name)
+
+def build_prompt(text: str, variant: str | None = None) -> str:
+    variant = variant or settings.prompt_variant
+    prompts = get_prompts()
+    if variant not in prompts:
+        raise ValueError(f"Variante de prompt inconnue : {variant!r} (attendu : {', '.join(PROMPT_VARIANTS)})")
+    with timed("prompt"):
+        return prompts[variant].render(text)
 
 # ─────────────────────────────
 # Appel Mistral Cloud
 # ─────────────────────────────
-def call_mistral_api(prompt: str) -> str:
-    api_key = settings.mistral_api_key or os.getenv("MISTRAL_API_KEY")
-    if not api_key:
-        raise RuntimeError("MISTRAL_API_KEY manquante (env/.env).")
-    client = Mistral(api_key=api_key)
-    res = client.chat.complete(
+SYSTEM_MESSAGE = "Tu es un assistant médical spécialisé en extraction structurée. Réponds UNIQUEMENT en JSON valide."
+
+# Client partagé (connexions keep-alive réutilisées entre requêtes)
+_mistral_client: "Mistral | None" = None
+_sync_http: httpx.Client | None = None
+_async_http: httpx.AsyncClient | None = None
+_llm_semaphore: asyncio.Semaphore | None = None
+
+def get_mistral_client() -> "Mistral":
+    global _mistral_client, _sync_http, _async_http
+    if _mistral_client is None:
+        from mistralai import Mistral  # SDK importé à la 1re utilisation (démarrage rapide)
+
+        api_key = settings.mistral_api_key
+        if not api_key:
+            raise RuntimeError("MISTRAL_API_KEY manquante (env/.env).")
+        limits = httpx.Limits(
+            max_connections=settings.mistral_max_connections,
+            max_keepalive_connections=settings.mistral_max_connections,
+        )
+        timeout = httpx.Timeout(settings.mistral_timeout_s)
+        _sync_http = httpx.Client(limits=limits, timeout=timeout)
+        _async_http = httpx.AsyncClient(limits=limits, timeout=timeout)
+        _mistral_client = Mistral(
+            api_key=api_key,
+            server_url=settings.mistral_server_url,
+            client=_sync_http,
+            async_client=_async_http,
+        )
+    return _mistral_client
+
+def _llm_slots() -> asyncio.Semaphore:
+    # borne le nombre d'appels LLM simultanés (créé à la 1re utilisation)
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(settings.mistral_max_concurrency)
+    return _llm_semaphore
+
+async def aclose_mistral_client() -> None:
+    global _mistral_client, _sync_http, _async_http
+    if _async_http is not None:
+        await _async_http.aclose()
+    if _sync_http is not None:
+        _sync_http.close()
+    _mistral_client, _sync_http, _async_http = None, None, None
+
+def _messages(prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt},
+    ]
+
+def _usage(res) -> dict:
+    # tokens facturés, tels que renvoyés par l'API
+    usage = getattr(res, "usage", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+def call_mistral_api(prompt: str) -> tuple[str, dict]:
+    res = get_mistral_client().chat.complete(
         model=settings.mistral_model_name,
-        messages=[
-            {"role": "system", "content": "Tu es un assistant médical spécialisé en extraction structurée. Réponds UNIQUEMENT en JSON valide."},
-            {"role": "user", "content": prompt},
-        ],
+        messages=_messages(prompt),
         temperature=settings.temperature,
     )
-    return res.choices[0].message.content.strip()
+    return res.choices[0].message.content.strip(), _usage(res)
+
+async def call_mistral_api_async(prompt: str) -> tuple[str, dict]:
+    client = get_mistral_client()
+    async with _llm_slots():
+        res = await client.chat.complete_async(
+            model=settings.mistral_model_name,
+            messages=_messages(prompt),
+            temperature=settings.temperature,
+        )
+    return res.choices[0].message.content.strip(), _usage(res)
+
+async def stream_mistral_api_async(prompt: str, usage: dict) -> AsyncIterator[str]:
+    """
+    Variante en flux : produit les fragments de texte au fil de la génération.
+    `usage` est complété avec les tokens facturés (dernier fragment).
+    """
+    client = get_mistral_client()
+    async with _llm_slots():
+        # async with : la réponse httpx est fermée (connexion rendue au pool)
+        # même si le client se déconnecte ou si le générateur est fermé en route
+        async with await client.chat.stream_async(
+            model=settings.mistral_model_name,
+            messages=_messages(prompt),
+            temperature=settings.temperature,
+        ) as stream:
+            async for chunk in stream:
+                if chunk.data.usage is not None:
+                    usage.update(_usage(chunk.data))
+                if chunk.data.choices and chunk.data.choices[0].delta.content:
+                    yield chunk.data.choices[0].delta.content
 
 # ─────────────────────────────
-# Extraction JSON robuste
+# Inférence locale (provider='local') : lots formés par app/scheduler.py
 # ─────────────────────────────
-def extract_json(text: str) -> dict:
-    if not text or not text.strip():
-        raise ValueError("Réponse vide.")
-
-    m = re.search(r"```json\s*(\{.*?\})\s*```", text, flags=re.S | re.I)
-    if m:
-        return json.loads(m.group(1))
-
-    m = re.search(r"```\s*(\{.*?\})\s*```", text, flags=re.S)
-    if m:
-        return json.loads(m.group(1))
-
-    s = text
-    starts = [i for i,c in enumerate(s) if c == "{"]
-    for st in starts:
-        depth = 0
-        for j in range(st, len(s)):
-            ch = s[j]
-            if ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    cand = s[st:j+1]
-                    try:
-                        return json.loads(cand)
-                    except json.JSONDecodeError:
-                        pass
-                    break
-    raise ValueError("Impossible d'extraire un JSON valide.")
+def _local() -> bool:
+    return settings.provider == "local"
+
+def call_local_model(text: str) -> tuple[str, dict]:
+    # ModelWrapper rend son propre prompt (schéma condensé) : on lui passe le document
+    return get_scheduler().generate(text).strip(), {"prompt_tokens": None, "completion_tokens": None}
+
+async def call_local_model_async(text: str) -> tuple[str, dict]:
+    out = await get_scheduler().generate_async(text)
+    return out.strip(), {"prompt_tokens": None, "completion_tokens": None}
+
+async def _local_fragments(text: str, usage: dict) -> AsyncIterator[str]:
+    raw, _ = await call_local_model_async(text)
+    yield raw
 
 # ─────────────────────────────
 # Validation JSON vs schéma
 # ─────────────────────────────
 def validate_json(data: dict) -> tuple[bool, str | None]:
-    try:
-        validate(instance=data, schema=SCHEMA)
+    """
+    Retourne toutes les erreurs (pas seulement la première), préfixées par
+    leur chemin JSON : "$.consultations[0].date: '2021-13-01' is not a 'date'".
+    """
+    errors = sorted(get_validator().iter_errors(data), key=lambda e: e.json_path)
+    if not errors:
         return True, None
-    except ValidationError as e:
-        return False, e.message
+    return False, "; ".join(f"{e.json_path}: {e.message}" for e in errors)
 
 # ─────────────────────────────
 # Pipeline texte → JSON final
 # ─────────────────────────────
-def process_text(text: str) -> tuple[dict, bool, str | None]:
-    prompt = build_prompt(text)
-    raw = call_mistral_api(prompt)
-    data = extract_json(raw)
-    valid, err = validate_json(data)
-    return data, valid, err
+# stats = {"cached", "prompt_variant", "prompt_tokens", "prompt_tokens_estimated",
+#          "completion_tokens", "llm_ms"} : renvoyées avec chaque extraction
+def _cache_lookup(text: str, use_cache: bool, variant: str) -> tuple[str | None, tuple | None]:
+    if not (use_cache and settings.cache_enabled):
+        return None, None
+    key = cache_key(text, variant)
+    hit = result_cache.get(key)
+    inc("cache_requests_total", cache="result", result="miss" if hit is None else "hit")
+    if hit is None:
+        return key, None
+    stats = {"cached": True, "prompt_variant": variant, "prompt_tokens": 0, "completion_tokens": 0}
+    return key, (hit["data"], hit["valid"], hit["error"], stats)
+
+def _finalize(raw: str, key: str | None, stats: dict) -> tuple[dict, bool, str | None, dict]:
+    try:
+        with timed("json"):
+            data = extract_json(raw)
+    except ValueError:
+        inc("validation_failures_total", reason="json")
+        raise
+    with timed("validate"):
+        valid, err = validate_json(data)
+    if not valid:
+        inc("validation_failures_total", reason="schema")
+
+    # on ne met en cache que les extractions conformes au schéma
+    if key and valid:
+        result_cache.set(key, {"data": data, "valid": valid, "error": err})
+    return data, valid, err, stats
+
+def _stats(prompt: str, variant: str, usage: dict, t0: float) -> dict:
+    # appelé juste après l'appel LLM (t0 = son début) : alimente aussi /metrics
+    llm_s = time.perf_counter() - t0
+    record_stage("llm", llm_s)
+    for kind in ("prompt", "completion"):
+        if isinstance(usage.get(f"{kind}_tokens"), int):
+            inc("llm_tokens_total", usage[f"{kind}_tokens"], kind=kind)
+    return {
+        "cached": False,
+        "prompt_variant": variant,
+        **usage,
+        "prompt_tokens_estimated": estimate_tokens(prompt),
+        "llm_ms": round(llm_s * 1000, 1),
+    }
+
+def process_text(text: str, use_cache: bool = True,
+                 variant: str | None = None) -> tuple[dict, bool, str | None, dict]:
+    variant = variant or settings.prompt_variant
+    key, hit = _cache_lookup(text, use_cache, variant)
+    if hit is not None:
+        return hit
+
+    prompt = build_prompt(text, variant)
+    t0 = time.perf_counter()
+    raw, usage = call_local_model(text) if _local() else call_mistral_api(prompt)
+    return _finalize(raw, key, _stats(prompt, variant, usage, t0))
+
+async def process_text_async(text: str, use_cache: bool = True,
+                             variant: str | None = None) -> tuple[dict, bool, str | None, dict]:
+    """
+    Variante async de process_text : l'appel LLM ne bloque pas de thread,
+    la concurrence est bornée par settings.mistral_max_concurrency.
+    """
+    variant = variant or settings.prompt_variant
+    key, hit = _cache_lookup(text, use_cache, variant)
+    if hit is not None:
+        return hit
+
+    prompt = build_prompt(text, variant)
+    t0 = time.perf_counter()
+    raw, usage = await (call_local_model_async(text) if _local() else call_mistral_api_async(prompt))
+    return _finalize(raw, key, _stats(prompt, variant, usage, t0))
+
+async def process_text_stream(text: str, use_cache: bool = True,
+                              variant: str | None = None) -> AsyncIterator[dict]:
+    """
+    Extraction en flux : événements "section"/"item" dès qu'une partie du JSON
+    est complète (voir SectionStreamParser), puis un événement "result" avec
+    l'enregistrement validé ({"json", "valid", "validation_error", "stats"}).
+    """
+    variant = variant or settings.prompt_variant
+    key, hit = _cache_lookup(text, use_cache, variant)
+    if hit is not None:
+        data, valid, err, stats = hit
+        for event in record_events(data):
+            yield event
+    else:
+        prompt = build_prompt(text, variant)
+        parser = SectionStreamParser()
+        usage: dict = {"prompt_tokens": None, "completion_tokens": None}
+        t0 = time.perf_counter()
+        first_ms = None
+        # modèle local : pas de flux, la sortie complète arrive en un fragment
+        fragments = _local_fragments(text, usage) if _local() else stream_mistral_api_async(prompt, usage)
+        async for fragment in fragments:
+            if first_ms is None:
+                first_ms = round((time.perf_counter() - t0) * 1000, 1)
+            for event in parser.feed(fragment):
+                yield event
+        stats = _stats(prompt, variant, usage, t0)
+        stats["first_token_ms"] = first_ms
+        data, valid, err, stats = _finalize(parser.buf, key, stats)
+    yield {"event": "result", "data": {"json": data, "valid": valid, "validation_error": err, "stats": stats}}
@@ -0,0 +1,279 @@
+# Indexation en masse : passages → embeddings → upserts Qdrant, en pipeline
+import hashlib, json, queue, threading, time
+from typing import Any, Dict, List, Optional
+from ..metrics import timed
+from ..settings import settings
+from .doc_store import document_store
+from .embeddings import embed_texts
+from .passage_builder import json_to_passages
+from .vectors_qdrant import (
+    apply_diff, apply_diffs, collection_dimension, collection_exists, diff_passages, ensure_collection, existing_points_many,
+    make_point, upsert_points,
+)
+
+_DONE = object()  # fin de flux entre deux étapes
+
+
+def doc_id_for(record: Dict) -> str:
+    """
+    doc_id stable : document_source.id_document, sinon hash du contenu.
+    Ré-indexer le même dossier met à jour ses points au lieu d'en créer un
+    second jeu. Pas de repli sur nom_fichier : deux patients peuvent avoir
+    un « compte_rendu.pdf », et l'un effacerait les passages de l'autre.
+    Le hash ignore `meta` (date d'extraction, modèle) : ré-extraire le même
+    PDF un autre jour ou avec un autre modèle garde le même doc_id.
+    """
+    key = (record.get("document_source") or {}).get("id_document")
+    if key:
+        key = f"source:{key}"
+    else:
+        content = {k: v for k, v in record.items() if k != "meta"}
+        key = "content:" + json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return "doc_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _prepare(record: Dict, doc_id: Optional[str] = None) -> tuple[str, List[str], List[Dict], Optional[str]]:
+    doc_id = doc_id or doc_id_for(record)
+    with timed("passages"):
+        passages = json_to_passages(record)
+    patient_nom = (record.get("patient") or {}).get("nom")
+    return doc_id, [t for t, _ in passages], [m for _, m in passages], patient_nom
+
+
+def _diff_counts(diff: Dict[str, Any]) -> Dict[str, int]:
+    return {"unchanged": diff["unchanged"], "updated": len(diff["payloads"]), "deleted": len(diff["removed"])}
+
+
+def _commit(doc_id: str, record: Dict, diff: Dict[str, Any], wait: bool = True) -> None:
+    # après l'upsert des nouveaux passages seulement : en cas d'échec d'embedding
+    # ou d'upsert, les anciens points et l'ancien dossier restent en place
+    apply_diff(diff, wait=wait)
+    # dossier complet stocké une fois ; les points Qdrant n'en gardent que le doc_id
+    document_store.save(doc_id, record)
+
+
+def index_document(doc: Dict) -> Dict[str, Any]:
+    """
+    Un dossier (utilisé par /index-json et les jobs), en incrémental : seuls
+    les passages nouveaux ou modifiés sont embeddés et upsertés, puis les
+    payloads modifiés sont réécrits et les passages disparus supprimés.
+    """
+    doc_id, texts, metas, patient_nom = _prepare(doc)
+    diff = diff_passages(doc_id, texts, metas, patient_nom)
+    new = diff["new"]
+    dimension = diff["dimension"] or collection_dimension()
+    if new:
+        vectors = embed_texts([texts[k] for k in new])
+        dimension = len(vectors[0])
+        # Crée / ajuste la collection à la bonne dimension (auto)
+        ensure_collection(vector_size=dimension)
+        upsert_points([make_point(diff["ids"][k], doc_id, texts[k], vec, metas[k], patient_nom)
+                       for k, vec in zip(new, vectors)])
+    _commit(doc_id, doc, diff)
+    return {"doc_id": doc_id, "inserted": len(new), **_diff_counts(diff), "dimension": dimension}
+
+
+class _StageStats:
+    def __init__(self):
+        self.items = 0      # passages / vecteurs / points traités
+        self.requests = 0   # appels embed_texts / upserts Qdrant
+        self.busy_s = 0.0   # temps de travail, hors attente des files
+
+    def report(self, wall_s: float) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "requests": self.requests,
+            "busy_s": round(self.busy_s, 3),
+            "items_per_s": round(self.items / self.busy_s, 1) if self.busy_s else None,
+            "utilisation": round(self.busy_s / wall_s, 3) if wall_s else None,
+        }
+
+
+def index_records(records: List[Dict], embed_batch: Optional[int] = None,
+                  upsert_batch: Optional[int] = None, queue_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Indexe des dossiers extraits avec trois étapes qui se recouvrent, reliées
+    par des files bornées (un thread par étape) :
+    1) passages : découpage et diff avec les points existants du doc_id ;
+       seuls les passages nouveaux ou modifiés continuent, en lots de
+       `embed_batch` (tous documents confondus), accompagnés des diffs des
+       dossiers qu'ils complètent ;
+    2) embeddings : un appel embed_texts par lot (lui-même découpé et
+       parallélisé par le client) ;
+    3) upserts : points accumulés par groupes de `upsert_batch`, envoyés avec
+       wait=False ; le dernier groupe attend l'application (wait=True). Une
+       fois tous les nouveaux points d'un dossier envoyés, ses payloads
+       modifiés sont réécrits, ses points retirés supprimés et le dossier
+       enregistré dans document_store.
+    Un doc_id présent plusieurs fois n'est indexé qu'une fois (dernière
+    occurrence). La première erreur arrête le pipeline et est relevée.
+    """
+    embed_batch = embed_batch or settings.index_embed_batch
+    upsert_batch = upsert_batch or settings.index_upsert_batch
+    queue_size = queue_size or settings.index_queue_size
+
+    to_embed: queue.Queue = queue.Queue(queue_size)
+    to_upsert: queue.Queue = queue.Queue(queue_size)
+    abort = threading.Event()
+    errors: List[BaseException] = []
+    stats = {"passages": _StageStats(), "embeddings": _StageStats(), "upserts": _StageStats()}
+    doc_ids = [doc_id_for(rec) for rec in records]
+    latest = dict(zip(doc_ids, records))
+    dimension: List[int] = []
+    changes = {"unchanged": 0, "updated": 0, "deleted": 0}
+
+    def put(q: queue.Queue, item) -> None:
+        while not abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if abort.is_set():
+                    return _DONE
+
+    # ── étapes ───────────────────────────────
+    def build() -> None:
+        st, batch, docs = stats["passages"], [], []
+        # aucun point existant si la collection n'existe pas encore (les doc_id sont uniques)
+        exists = collection_exists()
+        group: List[tuple] = []
+
+        def diff_group() -> None:
+            # un scroll pour tout le groupe plutôt qu'un par dossier
+            t0 = time.perf_counter()
+            existing = existing_points_many([g[0] for g in group]) if exists else {}
+            for doc_id, rec, texts, metas, patient_nom in group:
+                diff = diff_passages(doc_id, texts, metas, patient_nom, existing=existing.get(doc_id, {}))
+                for name, n in _diff_counts(diff).items():
+                    changes[name] += n
+                batch.extend((diff["ids"][k], doc_id, texts[k], metas[k], patient_nom) for k in diff["new"])
+                docs.append((doc_id, rec, diff))
+            group.clear()
+            st.busy_s += time.perf_counter() - t0
+
+        def send() -> None:
+            nonlocal batch, docs
+            st.requests += 1
+            put(to_embed, (batch, docs))
+            batch, docs = [], []
+
+        size = 0
+        for doc_id, rec in latest.items():
+            if abort.is_set():
+                return
+            t0 = time.perf_counter()
+            _, texts, metas, patient_nom = _prepare(rec, doc_id)
+            group.append((doc_id, rec, texts, metas, patient_nom))
+            size += len(texts)
+            st.items += len(texts)
+            st.busy_s += time.perf_counter() - t0
+            if size >= embed_batch:
+                diff_group()
+                size = 0
+                if len(batch) >= embed_batch:
+                    send()
+        if group:
+            diff_group()
+        if batch or docs:
+            send()
+
+    def embed() -> None:
+        st = stats["embeddings"]
+        while (item := get(to_embed)) is not _DONE and not abort.is_set():
+            batch, docs = item
+            points = []
+            if batch:
+                t0 = time.perf_counter()
+                vectors = embed_texts([b[2] for b in batch])
+                if not dimension:
+                    ensure_collection(vector_size=len(vectors[0]))
+                    dimension.append(len(vectors[0]))
+                points = [make_point(pid, doc_id, text, vec, meta, nom)
+                          for (pid, doc_id, text, meta, nom), vec in zip(batch, vectors)]
+                st.items += len(points)
+                st.requests += 1
+                st.busy_s += time.perf_counter() - t0
+            put(to_upsert, (points, docs))
+
+    def upsert() -> None:
+        st, pending = stats["upserts"], []
+        # dossiers en attente : (nb de points reçus quand leur dernier point est arrivé, docs)
+        waiting: List[tuple] = []
+        received = sent = 0
+
+        def flush(points, wait: bool) -> None:
+            nonlocal sent
+            t0 = time.perf_counter()
+            st.items += upsert_points(points, wait=wait)
+            sent += len(points)
+            st.requests += 1
+            st.busy_s += time.perf_counter() - t0
+
+        def commit_ready(wait: bool) -> None:
+            ready = []
+            while waiting and waiting[0][0] <= sent:
+                ready.extend(waiting.pop(0)[1])
+            if not ready:
+                return
+            t0 = time.perf_counter()
+            # une requête batch_update_points pour tous les dossiers complétés
+            apply_diffs([diff for _, _, diff in ready], wait=wait)
+            for doc_id, rec, _ in ready:
+                document_store.save(doc_id, rec)
+            st.busy_s += time.perf_counter() - t0
+
+        while (item := get(to_upsert)) is not _DONE and not abort.is_set():
+            points, docs = item
+            pending.extend(points)
+            received += len(points)
+            waiting.append((received, docs))
+            # on garde toujours un reste : le dernier groupe part avec wait=True
+            while len(pending) > upsert_batch:
+                flush(pending[:upsert_batch], wait=False)
+                pending = pending[upsert_batch:]
+            commit_ready(wait=False)
+        if abort.is_set():
+            return
+        if pending:
+            flush(pending, wait=True)
+        commit_ready(wait=True)
+
+    def stage(fn, out: Optional[queue.Queue]):
+        def run():
+            try:
+                fn()
+            except BaseException as e:
+                errors.append(e)
+                abort.set()
+            finally:
+                if out is not None:
+                    put(out, _DONE)
+        return threading.Thread(target=run, name=f"index-{fn.__name__}", daemon=True)
+
+    t0 = time.perf_counter()
+    threads = [stage(build, to_embed), stage(embed, to_upsert), stage(upsert, None)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_s = time.perf_counter() - t0
+    if errors:
+        raise errors[0]
+
+    return {
+        "documents": len(doc_ids),
+        "doc_ids": doc_ids,
+        "inserted": stats["upserts"].items,
+        **changes,
+        "dimension": dimension[0] if dimension else collection_dimension(),
+        "duration_s": round(wall_s, 3),
+        "documents_per_s": round(len(doc_ids) / wall_s, 1) if wall_s else None,
+        "stages": {name: st.report(wall_s) for name, st in stats.items()},
+    }
@@ -0,0 +1,322 @@
+# Jobs asynchrones : file persistante SQLite + workers (PDF → extraction → indexation optionnelle)
+import asyncio, hashlib, json, logging, os, sqlite3, threading, time, uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+from ..metrics import inc
+from ..settings import settings
+from .indexing import index_document
+from .long_document import extract_document_async
+from .pdf_text import extract_text_from_pdf
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    dedup_key    TEXT NOT NULL,
+    source       TEXT NOT NULL,
+    kind         TEXT NOT NULL,            -- pdf | text
+    options      TEXT NOT NULL,            -- JSON : index, use_cache, long_document, prompt_variant
+    status       TEXT NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    not_before   REAL NOT NULL DEFAULT 0,  -- backoff entre deux tentatives
+    lease_until  REAL,                     -- heartbeat du worker ; expiré = job repris
+    error        TEXT,
+    result       TEXT,
+    created_at   REAL NOT NULL,
+    started_at   REAL,
+    finished_at  REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, not_before);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs(dedup_key, status);
+"""
+
+
+class JobStore:
+    """
+    File persistante : une ligne SQLite par job, le contenu soumis (PDF ou
+    texte) dans `directory/payloads/<id>`. Les prises de job se font dans une
+    transaction IMMEDIATE : plusieurs processus peuvent partager la base.
+    Un job "running" dont le bail (lease_until) a expiré — worker tué,
+    redémarrage — est repris par le prochain claim ; chaque prise compte
+    comme une tentative.
+    """
+
+    def __init__(self, directory: str | Path, max_attempts: int = 3,
+                 retry_base_s: float = 5.0, lease_s: float = 120.0):
+        self.directory = Path(directory)
+        self.payloads = self.directory / "payloads"
+        self.payloads.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_s = retry_base_s
+        self.lease_s = lease_s
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.directory / "jobs.sqlite", isolation_level=None,
+                                   check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def _tx(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return out
+
+    def payload_path(self, job_id: str, kind: str) -> Path:
+        return self.payloads / f"{job_id}.{'pdf' if kind == 'pdf' else 'txt'}"
+
+    # ── Soumission / lecture ──────────────────
+    def submit(self, payload: bytes, kind: str, source: str, options: Dict[str, Any]) -> tuple[Dict, bool]:
+        """Renvoie (job, deduplicated) : un contenu déjà soumis avec les mêmes options réutilise son job."""
+        h = hashlib.sha256()
+        for part in (kind.encode(), json.dumps(options, sort_keys=True).encode(), payload):
+            h.update(part)
+            h.update(b"\0")
+        dedup_key = h.hexdigest()
+        job_id = uuid.uuid4().hex
+        path = self.payload_path(job_id, kind)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+
+        def insert(db):
+            row = db.execute("SELECT * FROM jobs WHERE dedup_key = ? AND status != ? ORDER BY created_at DESC LIMIT 1",
+                             (dedup_key, FAILED)).fetchone()
+            if row is not None:
+                return row, True
+            db.execute("INSERT INTO jobs (id, dedup_key, source, kind, options, status, max_attempts, created_at) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (job_id, dedup_key, source, kind, json.dumps(options), QUEUED, self.max_attempts, time.time()))
+            return db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone(), False
+
+        row, deduplicated = self._tx(insert)
+        if deduplicated:
+            path.unlink(missing_ok=True)
+        return _as_dict(row), deduplicated
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _as_dict(row) if row is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+    # ── Cycle de vie (workers) ────────────────
+    def claim(self) -> Optional[Dict]:
+        now = time.time()
+
+        def take(db):
+            # baux expirés sans tentative restante : échec définitif
+            db.execute("UPDATE jobs SET status = ?, finished_at = ?, "
+                       "error = COALESCE(error || ' ; ', '') || 'interrompu (worker arrêté)' "
+                       "WHERE status = ? AND lease_until < ? AND attempts >= max_attempts",
+                       (FAILED, now, RUNNING, now))
+            row = db.execute("SELECT id FROM jobs WHERE (status = ? AND not_before <= ?) "
+                             "OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                             (QUEUED, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, "
+                       "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                       (RUNNING, now + self.lease_s, now, row["id"]))
+            return db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+        row = self._tx(take)
+        return _as_dict(row) if row is not None else None
+
+    def heartbeat(self, job_id: str) -> None:
+        self._tx(lambda db: db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                                       (time.time() + self.lease_s, job_id, RUNNING)))
+
+    def complete(self, job: Dict, result: Dict) -> None:
+        self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_until = NULL, finished_at = ? WHERE id = ?",
+            (DONE, json.dumps(result, ensure_ascii=False), time.time(), job["id"])))
+        self.payload_path(job["id"], job["kind"]).unlink(missing_ok=True)
+
+    def release(self, job: Dict) -> None:
+        # arrêt propre du worker : rendu à la file sans consommer de tentative
+        self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts - 1, lease_until = NULL WHERE id = ? AND status = ?",
+            (QUEUED, job["id"], RUNNING)))
+
+    def fail(self, job: Dict, error: str) -> str:
+        """Nouvelle tentative (backoff exponentiel) tant qu'il en reste ; renvoie le nouveau statut."""
+        retry = job["attempts"] < job["max_attempts"]
+        status = QUEUED if retry else FAILED
+        delay = self.retry_base_s * 2 ** (job["attempts"] - 1)
+        self._tx(lambda db: db.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, not_before = ?, finished_at = ? WHERE id = ?",
+            (status, error, time.time() + delay, None if retry else time.time(), job["id"])))
+        return status
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _as_dict(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["options"] = json.loads(job["options"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+# ─────────────────────────────
+# Exécution d'un job
+# ─────────────────────────────
+async def run_job(store: JobStore, job: Dict) -> Dict:
+    opts = job["options"]
+    path = store.payload_path(job["id"], job["kind"])
+    if job["kind"] == "pdf":
+        # chemin (pas d'octets) : les processus du pool PDF ouvrent le fichier eux-mêmes
+        text = await asyncio.to_thread(extract_text_from_pdf, str(path))
+    else:
+        text = await asyncio.to_thread(path.read_text, encoding="utf-8")
+    if not text.strip():
+        raise ValueError("Aucun texte extrait du document.")
+    data, valid, err, stats = await extract_document_async(text, use_cache=opts.get("use_cache", True),
+                                                           long_document=opts.get("long_document"),
+                                                           variant=opts.get("prompt_variant"))
+    result = {"json": data, "valid": valid, "validation_error": err, "stats": stats, "index": None}
+    if opts.get("index"):
+        result["index"] = await asyncio.to_thread(index_document, data)
+    return result
+
+# ─────────────────────────────
+# Pool de workers (tâches asyncio de la boucle de l'API)
+# ─────────────────────────────
+class JobWorkers:
+    """
+    `n` tâches asyncio qui prennent les jobs dans la file : l'extraction
+    partage ainsi le client Mistral async et son semaphore avec les routes.
+    Un heartbeat prolonge le bail pendant le traitement ; à l'arrêt, les jobs
+    en cours sont annulés et remis en file. Les appels au store tournent dans
+    des threads que l'annulation n'interrompt pas : stop() attend qu'ils se
+    terminent, le store peut ensuite être fermé.
+    """
+
+    def __init__(self, store: JobStore, n: int, poll_s: float = 1.0):
+        self.store = store
+        self.n = n
+        self.poll_s = poll_s
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._inflight: Set[asyncio.Future] = set()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._loop(), name=f"job-worker-{k}") for k in range(self.n)]
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def _offload(self, fn, *args) -> asyncio.Future:
+        # appel au store dans un thread, suivi jusqu'à sa fin même si l'appelant est annulé
+        fut = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+        self._inflight.add(fut)
+        fut.add_done_callback(self._inflight.discard)
+        return fut
+
+    async def _call(self, fn, *args) -> Any:
+        return await asyncio.shield(self._offload(fn, *args))
+
+    async def _claim(self) -> Optional[Dict]:
+        claim = self._offload(self.store.claim)
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            # annulé pendant la transaction : un job pris entre-temps est rendu
+            # tout de suite, au lieu de rester "running" jusqu'à l'expiration du bail
+            claim.add_done_callback(self._release_claimed)
+            raise
+
+    def _release_claimed(self, claim: asyncio.Future) -> None:
+        if not claim.cancelled() and claim.exception() is None and claim.result() is not None:
+            self._offload(self.store.release, claim.result())
+
+    async def _loop(self) -> None:
+        while True:
+            job = await self._claim()
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_s)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await run_job(self.store, job)
+        except asyncio.CancelledError:
+            await self._call(self.store.release, job)
+            raise
+        except Exception as e:
+            status = await self._call(self.store.fail, job, str(e))
+            inc("jobs_total", status="retried" if status == QUEUED else FAILED)
+            logger.warning("job %s : tentative %d/%d en échec (%s)", job["id"], job["attempts"], job["max_attempts"], e)
+        else:
+            await self._call(self.store.complete, job, result)
+            inc("jobs_total", status=DONE)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.store.lease_s / 3)
+            await self._call(self.store.heartbeat, job_id)
+
+# ─────────────────────────────
+# Singletons (créés à la première utilisation / au démarrage de l'API)
+# ─────────────────────────────
+_store: Optional[JobStore] = None
+_workers: Optional[JobWorkers] = None
+
+def get_job_store() -> JobStore:
+    global _store
+    if _store is None:
+        _store = JobStore(Path(settings.outputs_dir) / "jobs", max_attempts=settings.jobs_max_attempts,
+                          retry_base_s=settings.jobs_retry_base_s, lease_s=settings.jobs_lease_s)
+    return _store
+
+def start_job_workers() -> None:
+    """Appelé dans le lifespan : reprend aussi les jobs en file / interrompus avant le redémarrage."""
+    global _workers
+    if settings.jobs_workers > 0 and _workers is None:
+        _workers = JobWorkers(get_job_store(), settings.jobs_workers)
+        _workers.start()
+
+def notify_job_workers() -> None:
+    if _workers is not None:
+        _workers.notify()
+
+async def stop_job_workers() -> None:
+    global _workers, _store
+    if _workers is not None:
+        await _workers.stop()  # attend aussi les appels au store encore en cours
+        _workers = None
+    if _store is not None:
+        _store.close()
+        _store = None
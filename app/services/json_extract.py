@@ -0,0 +1,177 @@
+# Extraction de l'objet JSON d'une réponse de modèle, en temps linéaire
+import json, re
+from typing import Any, List, Tuple
+
+_DECODER = json.JSONDecoder()
+
+# ouverture de bloc ``` ou ```json, suivie (après blancs) d'un '{'
+_FENCE = re.compile(r"```[ \t]*(?:json)?[ \t]*\r?\n?\s*(?=\{)", re.I)
+
+# échec de décodage à moins de N caractères de la fin = jeton coupé ("0.", "nul")
+_PARTIAL_TOKEN = 16
+
+# fenêtre initiale (doublée au besoin) des décodages d'objets imbriqués
+_WINDOW = 256
+# '{' décodés directement avant de construire l'arbre des objets
+_FAST_TRIES = 4
+
+# seuls caractères qui changent l'état du scanner
+_STRUCT = re.compile(r'[{}"]')
+# reste d'une chaîne JSON après le guillemet ouvrant (forme « déroulée », sans retour arrière)
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# début d'objet décodable : '{' puis, après blancs, une clé ou '}'
+_OBJECT_START = re.compile(r'\{[ \t\n\r]*(?=["}])')
+_BLANKS = re.compile(r"[ \t\n\r]*")
+
+_TRUNCATED = "JSON tronqué : la sortie s'arrête avant la fin de l'objet (sortie coupée ?)."
+
+# nœud : [début, fin exclue (None si jamais refermé), objets inclus]
+Node = list
+
+
+def _span_tree(text: str) -> List[Node]:
+    """
+    Un seul parcours : arbre des objets { ... } (accolades des chaînes JSON
+    ignorées), dans l'ordre du texte. Un '{' jamais refermé englobe tout ce qui suit.
+    """
+    roots: List[Node] = []
+    opened: List[Node] = []
+    pos = 0
+    while (m := _STRUCT.search(text, pos)) is not None:
+        i = m.start()
+        pos = i + 1
+        ch = text[i]
+        if not opened:
+            if ch == "{":
+                node = [i, None, []]
+                roots.append(node)
+                opened.append(node)
+        elif ch == '"':
+            end = _STRING_TAIL.match(text, pos)
+            if end is None:
+                break  # chaîne jamais refermée : sortie tronquée
+            pos = end.end()
+        elif ch == "{":
+            node = [i, None, []]
+            opened[-1][2].append(node)
+            opened.append(node)
+        else:
+            opened.pop()[1] = i + 1
+    return roots
+
+
+def _decode(text: str, begin: int, stop: int, window: int) -> Tuple[Any, int, str]:
+    """
+    Décode l'objet ouvert en `begin` sur text[begin:stop] → (objet, -1, "")
+    ou (None, position absolue de l'erreur, message). Le décodage porte sur des
+    tranches croissantes : le coût suit la distance parcourue jusqu'à l'erreur,
+    pas la taille de l'objet (et pas la position dans le texte, que
+    JSONDecodeError convertit en ligne/colonne).
+    """
+    while True:
+        cut = min(stop, begin + window)
+        try:
+            return _DECODER.raw_decode(text[begin:cut])[0], -1, ""
+        except json.JSONDecodeError as e:
+            pos, msg = begin + e.pos, e.msg
+        # erreur due à la coupe : on élargit
+        if cut == stop or (cut - pos > _PARTIAL_TOKEN and not msg.startswith("Unterminated string")):
+            return None, pos, msg
+        window *= 2
+
+
+def _truncated(text: str, pos: int, msg: str) -> bool:
+    return len(text) - pos <= _PARTIAL_TOKEN or msg.startswith("Unterminated string")
+
+
+def _fast_path(text: str) -> Tuple[bool, Any]:
+    """
+    Cas courant (JSON nu, peu de prose) : décodage direct des premiers '{'.
+    (True, objet) si trouvé ; (False, None) pour passer à l'arbre des objets.
+    """
+    pos = 0
+    for _ in range(_FAST_TRIES):
+        begin = text.find("{", pos)
+        if begin < 0:
+            raise ValueError("Impossible d'extraire un JSON valide.")
+        if _OBJECT_START.match(text, begin) is None:
+            pos, msg = _BLANKS.match(text, begin + 1).end(), "Expecting property name"
+        else:
+            try:
+                return True, _DECODER.raw_decode(text, begin)[0]
+            except json.JSONDecodeError as e:
+                pos, msg = e.pos, e.msg
+        # tronqué seulement si l'objet n'est jamais refermé : chaîne ouverte ou plus de '}'
+        if _truncated(text, pos, msg) and (msg.startswith("Unterminated string") or "}" not in text[pos:]):
+            raise ValueError(_TRUNCATED)
+        pos = begin + 1
+    return False, None
+
+
+def _first_object(text: str) -> Any:
+    roots = _span_tree(text)
+    n = len(text)
+    # pile de (objets frères restants, position d'erreur du décodage parent)
+    stack: List[Tuple[Any, int]] = [(iter(roots), -1)]
+    while stack:
+        siblings, error_at = stack[-1]
+        node = next(siblings, None)
+        if node is None:
+            stack.pop()
+            continue
+        begin, end, children = node
+        stop = n if end is None else end
+        if begin < error_at:
+            if stop <= error_at:
+                # entièrement lu par le décodage parent avant l'erreur : objet valide
+                obj, _, _ = _decode(text, begin, stop, stop - begin)
+                return obj
+            # le décodage parent y est entré et y a échoué : même erreur, on descend
+            stack.append((iter(children), error_at))
+            continue
+        if _OBJECT_START.match(text, begin) is None:
+            # ni clé ni '}' après '{' : accolade de prose, inutile de décoder
+            pos, msg = _BLANKS.match(text, begin + 1).end(), "Expecting property name"
+        else:
+            # objets de premier niveau disjoints : décodés d'un bloc
+            window = stop - begin if len(stack) == 1 else _WINDOW
+            obj, pos, msg = _decode(text, begin, stop, window)
+            if pos < 0:
+                return obj
+        if end is None and _truncated(text, pos, msg):
+            raise ValueError(_TRUNCATED)
+        # objet invalide : les objets qu'il inclut restent candidats
+        stack.append((iter(children), pos))
+    raise ValueError("Impossible d'extraire un JSON valide.")
+
+
+def extract_json(text: str) -> dict:
+    """
+    Stratégies, en temps linéaire (chaque caractère examiné un nombre borné de fois) :
+    1) blocs ```json / ``` (y compris doublés ou non refermés) : décodage direct
+       à partir du premier '{' du bloc, la prose qui suit est ignorée ;
+    2) sinon, premier objet décodable dans l'ordre du texte, parmi les objets
+       équilibrés repérés par un balayage qui ignore les accolades des chaînes
+       JSON ; un objet invalide est fouillé (ex. '{{"a": 1}}') ;
+    3) objet jamais refermé dont le décodage échoue en fin de texte →
+       ValueError explicite (sortie tronquée) plutôt qu'un fragment interne ;
+       s'il échoue plus tôt, c'était une accolade de prose : les objets
+       qu'elle englobe restent candidats.
+    Un JSON trop imbriqué pour le décodeur lève aussi ValueError.
+    """
+    if not text or not text.strip():
+        raise ValueError("Réponse vide.")
+    try:
+        read_to = 0
+        for m in _FENCE.finditer(text):
+            if m.end() < read_to:
+                continue  # dans une chaîne déjà lue par le bloc précédent
+            # premier bloc décodé d'un coup, les suivants par tranches
+            window = len(text) if read_to == 0 else _WINDOW
+            obj, read_to, _ = _decode(text, m.end(), len(text), window)
+            if read_to < 0:
+                return obj
+        found, obj = _fast_path(text)
+        return obj if found else _first_object(text)
+    except RecursionError as e:
+        raise ValueError("JSON trop imbriqué pour être décodé.") from e
@@ -0,0 +1,184 @@
+# Documents longs : découpage en morceaux → extraction parallèle → fusion
+import asyncio, json
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from ..settings import settings
+from .extractor import process_text_async, validate_json
+from .prompts import CHARS_PER_TOKEN, estimate_tokens
+
+# ─────────────────────────────
+# Découpage
+# ─────────────────────────────
+def split_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Découpe `text` en morceaux d'au plus ~max_tokens, aux frontières de lignes.
+    Les dernières lignes d'un morceau (~overlap_tokens) sont répétées au début
+    du suivant pour ne pas couper une consultation en deux.
+    """
+    max_chars = max(1, int(max_tokens * CHARS_PER_TOKEN))
+    # recouvrement borné à la moitié d'un morceau : sinon la queue répétée
+    # remplit chaque morceau et leur nombre explose (un appel LLM par morceau)
+    overlap_chars = min(max(0, int(overlap_tokens * CHARS_PER_TOKEN)), max_chars // 2)
+
+    lines: List[str] = []
+    for line in text.splitlines():
+        # une ligne géante (OCR sans retours) est coupée brutalement
+        while len(line) > max_chars:
+            lines.append(line[:max_chars])
+            line = line[max_chars:]
+        lines.append(line)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in lines:
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            # recouvrement : on repart des dernières lignes du morceau
+            tail: List[str] = []
+            tail_size = 0
+            for prev in reversed(current):
+                if tail_size + len(prev) + 1 > overlap_chars:
+                    break
+                tail.insert(0, prev)
+                tail_size += len(prev) + 1
+            current, size = tail, tail_size
+        current.append(line)
+        size += len(line) + 1
+    if current and any(l.strip() for l in current):
+        chunks.append("\n".join(current))
+    return chunks
+
+# ─────────────────────────────
+# Fusion déterministe des extractions partielles
+# ─────────────────────────────
+def _norm(value: Any) -> Any:
+    return value.strip().casefold() if isinstance(value, str) else value
+
+def _empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+def _merge_objects(objs: Iterable[Optional[Dict]]) -> Dict:
+    # pour chaque champ : première valeur non vide, dans l'ordre des morceaux
+    out: Dict = {}
+    for obj in objs:
+        for k, v in (obj or {}).items():
+            if _empty(out.get(k)) and not _empty(v):
+                out[k] = v
+            else:
+                out.setdefault(k, v)
+    return out
+
+def _merge_list(items: Iterable[Dict], key: Callable[[Dict], Any]) -> List[Dict]:
+    merged: Dict[Any, Dict] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        k = key(item)
+        if k is None or all(x is None for x in (k if isinstance(k, tuple) else (k,))):
+            # pas de clé exploitable : on ne dédoublonne que les doublons exacts
+            k = ("__raw__", json.dumps(item, sort_keys=True, ensure_ascii=False))
+        merged[k] = _merge_objects([merged.get(k), item]) if k in merged else dict(item)
+    return list(merged.values())
+
+def _union(values: Iterable[Any]) -> List[Any]:
+    seen, out = set(), []
+    for v in values:
+        k = _norm(v)
+        if v is not None and k not in seen:
+            seen.add(k)
+            out.append(v)
+    return out
+
+def merge_records(parts: List[Dict]) -> Dict:
+    """
+    Fusionne des MedicalRecord partiels (un par morceau, dans l'ordre du document).
+    Dédoublonnage : consultations par date, traitements par médicament,
+    antécédents par condition, examens par (date, type), maladies par nom.
+    """
+    def lists(key: str) -> List[Dict]:
+        return [x for p in parts for x in (p.get(key) or [])]
+
+    resumes = [p.get("resume_structure") or {} for p in parts]
+    out: Dict = {
+        "patient": _merge_objects(p.get("patient") for p in parts),
+        "antecedents_medicaux": _merge_list(lists("antecedents_medicaux"), lambda x: _norm(x.get("condition"))),
+        "traitements_actuels": _merge_list(lists("traitements_actuels"), lambda x: _norm(x.get("medicament"))),
+        "consultations": _merge_list(lists("consultations"), lambda x: x.get("date")),
+        "examens": _merge_list(lists("examens"), lambda x: (x.get("date"), _norm(x.get("type")))),
+        "resume_structure": {
+            "maladies": _merge_list([m for r in resumes for m in (r.get("maladies") or [])],
+                                    lambda x: _norm(x.get("nom"))),
+            "allergies": _union(a for r in resumes for a in (r.get("allergies") or [])),
+            "traitements": _union(t for r in resumes for t in (r.get("traitements") or [])),
+        },
+        "meta": _merge_objects(p.get("meta") for p in parts),
+        "document_source": _merge_objects(p.get("document_source") for p in parts),
+    }
+
+    scores = [p["meta"]["confiance_moyenne"] for p in parts
+              if isinstance((p.get("meta") or {}).get("confiance_moyenne"), (int, float))]
+    if scores:
+        out["meta"]["confiance_moyenne"] = round(sum(scores) / len(scores), 3)
+    if not out["document_source"]:
+        del out["document_source"]
+
+    # clés hors schéma éventuelles : première valeur non vide
+    for p in parts:
+        for k, v in p.items():
+            if k not in out and not _empty(v):
+                out[k] = v
+    return out
+
+# ─────────────────────────────
+# Pipeline
+# ─────────────────────────────
+def _sum_stats(stats: List[Dict], n_chunks: int) -> Dict:
+    def total(key: str) -> int | None:
+        values = [st.get(key) for st in stats if st.get(key) is not None]
+        return sum(values) if values else None
+
+    return {
+        "cached": bool(stats) and all(st.get("cached") for st in stats),
+        "prompt_variant": stats[0].get("prompt_variant") if stats else None,
+        "prompt_tokens": total("prompt_tokens"),
+        "prompt_tokens_estimated": total("prompt_tokens_estimated"),
+        "completion_tokens": total("completion_tokens"),
+        # morceaux en parallèle : la latence utile est celle du plus lent
+        "llm_ms": max((st.get("llm_ms") or 0 for st in stats), default=None),
+        "chunks": n_chunks,
+    }
+
+async def process_long_text_async(text: str, use_cache: bool = True,
+                                  variant: str | None = None) -> tuple[dict, bool, str | None, dict]:
+    chunks = split_text(text, settings.chunk_max_tokens, settings.chunk_overlap_tokens)
+    n = len(chunks)
+    # tous les morceaux partent en même temps (bornés par le semaphore LLM)
+    results = await asyncio.gather(
+        *(process_text_async(f"(Extrait {i + 1}/{n} d'un document plus long)\n{c}",
+                             use_cache=use_cache, variant=variant)
+          for i, c in enumerate(chunks)),
+        return_exceptions=True,
+    )
+    ok = [r for r in results if not isinstance(r, BaseException)]
+    failed = [i + 1 for i, r in enumerate(results) if isinstance(r, BaseException)]
+    if not ok:
+        raise results[0]
+
+    data = merge_records([r[0] for r in ok])
+    valid, err = validate_json(data)
+    if failed:
+        valid = False
+        err = "; ".join(filter(None, [err, f"extraits en échec : {failed}/{n}"]))
+    return data, valid, err, _sum_stats([r[3] for r in ok], n)
+
+async def extract_document_async(text: str, use_cache: bool = True, long_document: bool | None = None,
+                                 variant: str | None = None) -> tuple[dict, bool, str | None, dict]:
+    """
+    Point d'entrée des routers : appel unique, ou map-reduce si le document
+    dépasse settings.long_doc_threshold_tokens (ou si long_document=True).
+    """
+    if long_document is None:
+        long_document = estimate_tokens(text) > settings.long_doc_threshold_tokens
+    if long_document:
+        return await process_long_text_async(text, use_cache=use_cache, variant=variant)
+    return await process_text_async(text, use_cache=use_cache, variant=variant)
@@ -0,0 +1,118 @@
+# Extraction du texte PDF page par page (pool de processus pour les gros documents)
+import io, os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import BinaryIO, Iterator, List, Tuple, Union
+import pdfplumber
+from ..metrics import timed
+from ..settings import settings
+
+PdfSource = Union[str, os.PathLike, bytes, BinaryIO]
+
+_pool: ProcessPoolExecutor | None = None
+
+def _workers() -> int:
+    return settings.pdf_workers or os.cpu_count() or 1
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # "spawn" : pas de fork d'un serveur multi-thread (uvicorn, httpx)
+        _pool = ProcessPoolExecutor(max_workers=_workers(),
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_pdf_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _open(source: PdfSource):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+def _share(source) -> Tuple[SharedMemory, int]:
+    # copie unique du PDF en mémoire partagée (pas de fichier sur disque)
+    if hasattr(source, "read"):
+        source.seek(0, io.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+    else:
+        source = memoryview(source).cast("B")  # bytes, bytearray ou memoryview
+        size = len(source)
+    shm = SharedMemory(create=True, size=max(size, 1))
+    try:
+        if hasattr(source, "read"):
+            pos = 0
+            while chunk := source.read(1024 * 1024):
+                shm.buf[pos:pos + len(chunk)] = chunk
+                pos += len(chunk)
+        else:
+            shm.buf[:size] = source
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, size
+
+def _extract_range(ref: Union[str, Tuple[str, int]], start: int, stop: int) -> List[str]:
+    # exécuté dans un processus du pool : ouvre sa propre copie du PDF ; seul le
+    # chemin ou le nom du segment de mémoire partagée transite
+    if isinstance(ref, tuple):
+        name, size = ref
+        shm = SharedMemory(name=name)
+        try:
+            source = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+    else:
+        source = ref
+    out = []
+    with _open(source) as pdf:
+        for page in pdf.pages[start:stop]:
+            out.append(page.extract_text() or "")
+            page.close()  # libère le cache d'objets de la page
+    return out
+
+def iter_pdf_pages(source: PdfSource, parallel: bool = True) -> Iterator[str]:
+    """
+    Génère le texte de chaque page, dans l'ordre, dès qu'elle est prête.
+    Au-delà de settings.pdf_parallel_min_pages, les pages sont réparties par
+    blocs de settings.pdf_pages_per_task sur un pool de settings.pdf_workers processus.
+    """
+    with _open(source) as pdf:
+        n_pages = len(pdf.pages)
+        if not parallel or _workers() <= 1 or n_pages < settings.pdf_parallel_min_pages:
+            for page in pdf.pages:
+                yield page.extract_text() or ""
+                page.close()
+            return
+
+    # Flux et octets : copiés une seule fois en mémoire partagée ; chaque tâche
+    # ne reçoit que son nom (pas une copie du PDF par bloc de pages)
+    shm, futures = None, []
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            ref = os.fspath(source)
+        else:
+            shm, size = _share(source)
+            ref = (shm.name, size)
+        step = max(1, settings.pdf_pages_per_task)
+        pool = _get_pool()
+        futures = [pool.submit(_extract_range, ref, start, min(start + step, n_pages))
+                   for start in range(0, n_pages, step)]
+        for fut in futures:
+            yield from fut.result()
+    finally:
+        # consommateur arrêté en route : on annule les blocs pas encore lancés
+        for fut in futures:
+            fut.cancel()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+def extract_text_from_pdf(source: PdfSource) -> str:
+    with timed("pdf"):
+        return "\n".join(iter_pdf_pages(source)).strip()
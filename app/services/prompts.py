@@ -0,0 +1,93 @@
+# Gabarits de prompt précompilés + estimation du nombre de tokens
+import json, math
+from datetime import date
+from typing import Dict
+
+# Approximation du tokenizer Mistral sur du texte médical français
+CHARS_PER_TOKEN = 3.5
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# Schéma condensé (aussi utilisé par l'inférence locale, app/infer.py)
+CONDENSED_SCHEMA = """- patient (id|null, nom, date_naissance, sexe, adresse|null)
+- antecedents_medicaux[] (condition, date_diagnostic|null, status|null, type|null, gravite|null)
+- traitements_actuels[] (medicament, dose|null, posologie|null, indication|null, debut_traitement|null, fin_traitement|null)
+- consultations[] (date, motif|null, observations|null, diagnostic|null, traitement_prescrit|null)
+- examens[] (date, type, resultat|null)
+- resume_structure (maladies[] {nom, premiere_mention|null, statut|null, derniere_consultation|null, confiance|null[0..1]}, allergies[], traitements[])
+- meta (langue, source, date_extraction, modele_utilise, confiance_moyenne|null[0..1], schema_version)
+- document_source (nom_fichier, type, id_document|null)"""
+
+# full      : schéma JSON indenté (historique)
+# compact   : même schéma JSON, minifié
+# condensed : résumé des clés (le moins de tokens)
+PROMPT_VARIANTS = ("full", "compact", "condensed")
+
+_TEMPLATE = """
+Tu es un extracteur clinique. À partir du texte source, produis STRICTEMENT un JSON conforme au schéma.
+
+Règles strictes :
+- Sortie = JSON UNIQUEMENT (aucun commentaire, aucune prose).
+- N’utilise que les caractères JSON : {{ }} [ ] , : " .
+- Dates au format YYYY-MM-DD ; si inconnu -> null (si mois/jour inconnus → 01 par défaut).
+- N'invente rien ; si absent → null ou [].
+- Respecte toutes les clés/type du schéma.
+
+{schema_label} :
+{schema}
+
+Contraintes meta :
+- meta.langue = "fr"
+- meta.date_extraction = "{today}"
+- meta.modele_utilise = "{model}"
+- meta.schema_version = "1.0"
+
+Texte source :
+<<<
+{text}
+>>>
+
+⚠️ IMPORTANT :
+- Un seul objet JSON valide, commençant par '{{' et finissant par '}}'.
+- AUCUN TEXTE hors JSON.
+"""
+
+_TODAY, _TEXT = "\x00TODAY\x00", "\x00TEXT\x00"
+
+
+def render_schema(schema: Dict, variant: str) -> str:
+    if variant == "full":
+        return json.dumps(schema, ensure_ascii=False, indent=2)
+    if variant == "compact":
+        return json.dumps(schema, ensure_ascii=False, separators=(",", ":"))
+    if variant == "condensed":
+        return CONDENSED_SCHEMA
+    raise ValueError(f"Variante de prompt inconnue : {variant!r} (attendu : {', '.join(PROMPT_VARIANTS)})")
+
+
+class PromptTemplate:
+    """
+    Partie statique du prompt (règles + schéma sérialisé) calculée une seule fois ;
+    render() ne fait plus que concaténer la date du jour et le texte source.
+    """
+
+    def __init__(self, schema: Dict, variant: str, model_name: str):
+        self.variant = variant
+        full = _TEMPLATE.format(
+            schema_label="Schéma condensé" if variant == "condensed" else "Schéma JSON",
+            schema=render_schema(schema, variant),
+            model=model_name,
+            today=_TODAY,
+            text=_TEXT,
+        )
+        self._head, rest = full.split(_TODAY)
+        self._middle, self._tail = rest.split(_TEXT)
+        self.static_tokens = estimate_tokens(self._head + self._middle + self._tail) + 3  # + date
+
+    def render(self, text: str) -> str:
+        return self._head + date.today().isoformat() + self._middle + text + self._tail
+
+
+def compile_prompts(schema: Dict, model_name: str) -> Dict[str, PromptTemplate]:
+    return {v: PromptTemplate(schema, v, model_name) for v in PROMPT_VARIANTS}
@@ -0,0 +1,63 @@
+# Recherche sémantique : embedding des requêtes (LRU) + kNN Qdrant
+from typing import Dict, List
+from ..settings import settings
+from .cache import LRUCache
+from .embeddings import get_backend
+from .vectors_qdrant import hydrate_hits, knn_search, knn_search_batch
+
+# les requêtes ne passent pas par le cache disque des passages : LRU mémoire seulement
+query_cache = LRUCache(max_entries=settings.search_query_cache_entries)
+
+
+def embed_queries(queries: List[str]) -> List[list]:
+    """Un vecteur par requête ; requêtes en double et déjà vues non renvoyées à l'API."""
+    backend = get_backend()
+    unique = list(dict.fromkeys(queries))
+    vectors: Dict[str, list] = {}
+    for q in unique:
+        vec = query_cache.get(f"{backend.model}\0{q}")
+        if vec is not None:
+            vectors[q] = vec
+    missing = [q for q in unique if q not in vectors]
+    if missing:
+        for q, vec in zip(missing, backend.embed(missing)):
+            query_cache.set(f"{backend.model}\0{q}", vec)
+            vectors[q] = vec
+    return [vectors[q] for q in queries]
+
+
+def slim_hit(hit) -> Dict:
+    payload = hit.payload or {}
+    return {
+        "id": hit.id,
+        "score": hit.score,
+        "doc_id": payload.get("doc_id"),
+        "section": payload.get("section"),
+        "patient_nom": payload.get("patient_nom"),
+        "text": payload.get("text"),
+        "meta": payload.get("meta"),
+        "record": payload.get("raw_json"),  # seulement si hydrate=True
+    }
+
+
+def _filters(q: Dict) -> Dict:
+    return {k: q.get(k) for k in ("doc_id", "section", "patient_nom")}
+
+
+def _top_k(q: Dict) -> int:
+    return min(q.get("top_k") or 5, settings.search_max_top_k)
+
+
+def search(query: Dict) -> List[Dict]:
+    """query : champs de SearchQuery (query, top_k, doc_id, section, patient_nom, hydrate)."""
+    vec = embed_queries([query["query"]])[0]
+    hits = knn_search(vec, top_k=_top_k(query), hydrate=bool(query.get("hydrate")), **_filters(query))
+    return [slim_hit(h) for h in hits]
+
+
+def search_batch(queries: List[Dict]) -> List[List[Dict]]:
+    """Un seul appel d'embedding et un seul search_batch Qdrant pour toutes les requêtes."""
+    vecs = embed_queries([q["query"] for q in queries])
+    res = knn_search_batch(vecs, top_k=[_top_k(q) for q in queries], filters=[_filters(q) for q in queries])
+    hydrate_hits([h for q, hits in zip(queries, res) if q.get("hydrate") for h in hits])
+    return [[slim_hit(h) for h in hits] for hits in res]
@@ -0,0 +1,149 @@
+# Analyse JSON incrémentale d'une sortie de modèle reçue en flux (tokens)
+import json
+from typing import Any, Dict, List
+
+
+class SectionStreamParser:
+    """
+    Reçoit la sortie du modèle morceau par morceau (feed) et renvoie, dès
+    qu'elles sont complètes :
+    - {"event": "item", "data": {"section", "index", "value"}} pour chaque
+      élément d'un tableau de premier niveau (consultations[0], ...) ;
+    - {"event": "section", "data": {"section", "value"}} pour chaque clé de
+      premier niveau dont la valeur est terminée (patient, meta, ...).
+    La prose ou le bloc ``` avant le premier '{' est ignoré, tout comme ce qui
+    suit la fermeture de l'objet racine. Chaque caractère n'est lu qu'une fois.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.started = False
+        self.done = False
+        self.depth = 0
+        self.in_str = False
+        self.escape = False
+        self.expect_key = False
+        self.key: str | None = None
+        self.key_start: int | None = None
+        self.value_start: int | None = None
+        self.container: str | None = None  # '{' ou '[' pour la valeur de premier niveau en cours
+        self.item_start: int | None = None
+        self.item_index = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.buf += chunk
+        events: List[Dict[str, Any]] = []
+        buf = self.buf
+        for i in range(self.pos, len(buf)):
+            if self.done:
+                break
+            ch = buf[i]
+            if not self.started:
+                if ch == "{":
+                    self.started, self.depth, self.expect_key = True, 1, True
+                continue
+            if self.in_str:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_str = False
+                    if self.key_start is not None:
+                        try:
+                            self.key = self._loads(self.key_start, i + 1)
+                        except ValueError:
+                            self.key = None
+                        self.key_start = None
+                continue
+            self._step(i, ch, events)
+        self.pos = len(buf)
+        return events
+
+    # ── automate ─────────────────────────────
+    def _in_top_array(self) -> bool:
+        return self.depth == 2 and self.container == "["
+
+    def _step(self, i: int, ch: str, events: List[Dict[str, Any]]) -> None:
+        if ch == '"':
+            self.in_str = True
+            if self.depth == 1:
+                if self.expect_key:
+                    self.key_start, self.expect_key = i, False
+                elif self.value_start is None:
+                    self.value_start = i
+            elif self._in_top_array() and self.item_start is None:
+                self.item_start = i
+        elif ch in "{[":
+            if self.depth == 1:
+                self.value_start, self.container = i, ch
+            elif self._in_top_array() and self.item_start is None:
+                self.item_start = i
+            self.depth += 1
+        elif ch in "}]":
+            if self.depth == 1:  # fermeture de l'objet racine
+                self._flush_value(i, events)
+                self.depth, self.done = 0, True
+                return
+            if self._in_top_array():
+                self._flush_item(i, events)  # dernier élément scalaire éventuel
+            self.depth -= 1
+            if self._in_top_array() and self.item_start is not None:
+                self._emit_item(self.item_start, i + 1, events)
+            elif self.depth == 1:
+                self._emit_section(self.value_start, i + 1, events)
+        elif ch == ",":
+            if self.depth == 1:
+                self._flush_value(i, events)
+                self.expect_key = True
+            elif self._in_top_array():
+                self._flush_item(i, events)
+        elif ch != ":" and not ch.isspace():
+            # début d'un scalaire (nombre, true, false, null)
+            if self.depth == 1 and not self.expect_key and self.value_start is None:
+                self.value_start = i
+            elif self._in_top_array() and self.item_start is None:
+                self.item_start = i
+
+    def _loads(self, start: int, end: int) -> Any:
+        return json.loads(self.buf[start:end])
+
+    def _flush_value(self, end: int, events: List[Dict[str, Any]]) -> None:
+        # valeur scalaire de premier niveau en attente (les conteneurs sont émis à leur fermeture)
+        if self.value_start is not None:
+            self._emit_section(self.value_start, end, events)
+
+    def _flush_item(self, end: int, events: List[Dict[str, Any]]) -> None:
+        if self.item_start is not None:
+            self._emit_item(self.item_start, end, events)
+
+    def _emit_section(self, start: int, end: int, events: List[Dict[str, Any]]) -> None:
+        try:
+            value = self._loads(start, end)
+        except ValueError:
+            pass  # section mal formée : la validation finale le signalera
+        else:
+            events.append({"event": "section", "data": {"section": self.key, "value": value}})
+        self.value_start, self.container, self.item_index = None, None, 0
+
+    def _emit_item(self, start: int, end: int, events: List[Dict[str, Any]]) -> None:
+        try:
+            value = self._loads(start, end)
+        except ValueError:
+            pass
+        else:
+            events.append({"event": "item", "data": {"section": self.key, "index": self.item_index, "value": value}})
+        self.item_start = None
+        self.item_index += 1
+
+
+def record_events(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Mêmes événements que le parseur, pour un enregistrement déjà complet (cache)."""
+    events: List[Dict[str, Any]] = []
+    for key, value in record.items():
+        if isinstance(value, list):
+            events.extend({"event": "item", "data": {"section": key, "index": i, "value": v}}
+                          for i, v in enumerate(value))
+        events.append({"event": "section", "data": {"section": key, "value": value}})
+    return events
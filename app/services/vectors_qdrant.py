@@ -1,61 +1,287 @@
-import os, uuid
-from typing import List, Dict
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct, Filter, FieldCondition, MatchValue
-from dotenv import load_dotenv
-
-load_dotenv()  # par défaut, il cherche un fichier .env à la racine
-QDRANT_HOST = os.getenv("QDRANT_HOST")
-print("QDRANT_HOST =", QDRANT_HOST)
-QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
-
-COLLECTION = os.getenv("QDRANT_COLLECTION", "medical_records")
-API_KEY= os.getenv("api_key")
-print("API_KEY" , API_KEY)
-client = QdrantClient(url=QDRANT_HOST, api_key=API_KEY)
-
-def ensure_collection(vector_size: int):
-    # recrée la collection si elle n'existe pas avec la bonne dimension
-    try:
-        info = client.get_collection(COLLECTION)
-        # si la taille ne correspond pas, on la recrée
-        # (on simplifie: on recrée toujours)
-        client.recreate_collection(
-            collection_name=COLLECTION,
-            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
+import uuid, threading
+from typing import TYPE_CHECKING, Any, List, Dict, Optional
+from ..metrics import timed
+from ..settings import settings
+from .doc_store import document_store
+from .embeddings import EmbeddingBackend, get_backend
+
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import PointStruct
+
+COLLECTION = settings.qdrant_collection
+
+# Client créé à la première utilisation (l'import ne contacte pas Qdrant)
+_client: "QdrantClient | None" = None
+_client_lock = threading.Lock()
+
+def _models():
+    # qdrant_client importé à la 1re utilisation (~0,6 s sinon au démarrage)
+    from qdrant_client import models
+    return models
+
+def get_qdrant_client() -> "QdrantClient":
+    global _client
+    with _client_lock:
+        if _client is None:
+            from qdrant_client import QdrantClient
+
+            if settings.qdrant_host == ":memory:":
+                _client = QdrantClient(location=":memory:")  # tests / benchmarks hors ligne
+            else:
+                _client = QdrantClient(url=settings.qdrant_host, port=settings.qdrant_port,
+                                       api_key=settings.qdrant_api_key)
+        return _client
+
+def close_qdrant_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _collections.clear()
+
+DISTANCE = "Cosine"  # models.Distance.COSINE
+# champs filtrables de knn_search : index keyword pour éviter un parcours complet
+INDEXED_FIELDS = ("doc_id", "section", "patient_nom")
+
+def collection_for(backend: EmbeddingBackend) -> str:
+    # collection historique pour Mistral ; une collection par backend/dimension sinon
+    if backend.name == "mistral":
+        return COLLECTION
+    return f"{COLLECTION}__{backend.name}_d{backend.dim}"
+
+def active_collection() -> str:
+    return collection_for(get_backend())
+
+# collections déjà vérifiées dans ce processus → dimension des vecteurs
+_collections: Dict[str, int] = {}
+_collections_lock = threading.Lock()
+
+def _check_collection(name: str, vector_size: int) -> None:
+    client = get_qdrant_client()
+    info = client.get_collection(name)
+    params = info.config.params.vectors
+    if isinstance(params, dict):
+        raise RuntimeError(f"Collection Qdrant '{name}' : vecteurs nommés non pris en charge")
+    if params.size != vector_size or params.distance != DISTANCE:
+        raise RuntimeError(
+            f"Collection Qdrant '{name}' incompatible : {params.size} dimensions / {params.distance}, "
+            f"attendu {vector_size} / {DISTANCE} (changement de modèle d'embedding ?)"
         )
-    except Exception:
-        client.recreate_collection(
-            collection_name=COLLECTION,
-            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
+    # collections créées avant l'ajout des index
+    existing = info.payload_schema or {}
+    for field in INDEXED_FIELDS:
+        if field not in existing:
+            client.create_payload_index(name, field_name=field, field_schema=_models().PayloadSchemaType.KEYWORD)
+
+def ensure_collection(vector_size: int, collection: str | None = None) -> None:
+    """
+    Idempotent : crée la collection (et ses index de payload) seulement si elle
+    n'existe pas, sinon vérifie dimension et distance. Le résultat est mémorisé
+    dans le processus ; une dimension différente lève une RuntimeError.
+    Par défaut : la collection du backend d'embedding actif.
+    """
+    collection = collection or active_collection()
+    known = _collections.get(collection)
+    if known is None:
+        with _collections_lock:
+            known = _collections.get(collection)
+            if known is None:
+                client = get_qdrant_client()
+                if client.collection_exists(collection):
+                    _check_collection(collection, vector_size)
+                else:
+                    try:
+                        client.create_collection(
+                            collection_name=collection,
+                            vectors_config=_models().VectorParams(size=vector_size, distance=DISTANCE),
+                        )
+                    except Exception:
+                        # créée entre-temps par un autre worker
+                        if not client.collection_exists(collection):
+                            raise
+                    _check_collection(collection, vector_size)
+                _collections[collection] = known = vector_size
+    if known != vector_size:
+        raise RuntimeError(
+            f"Collection Qdrant '{collection}' en {known} dimensions, vecteurs reçus en {vector_size}"
         )
 
-def upsert_passages(doc_id: str, texts: List[str], vectors: List[List[float]], metas: List[Dict], raw_json: Dict):
-    points = []
-    for i, (vec, text, meta) in enumerate(zip(vectors, texts, metas)):
-        pid = int(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}-{i}").int % (10**12))
-        payload = {
-            "doc_id": doc_id,
-            "text": text,
-            "section": meta.get("section"),
-            "meta": meta,
-            "raw_json": raw_json,
-            "provider": "mistral",
-            "embed_model": os.getenv("MISTRAL_EMBED_MODEL", "mistral-embed"),
-        }
-        points.append(PointStruct(id=pid, vector=vec, payload=payload))
-    client.upsert(collection_name=COLLECTION, points=points)
+_POINT_NS = uuid.UUID("6f1c8f4e-2b1d-5a0e-9a57-0d6c1f3e9b21")
+
+def passage_ids(doc_id: str, texts: List[str]) -> List[str]:
+    """
+    Id de point = uuid5(doc_id, modèle d'embedding, texte, n° d'occurrence) :
+    un passage inchangé garde son id d'une indexation à l'autre (pas de
+    ré-embedding) ; changer de modèle change tous les ids.
+    """
+    model, seen, out = get_backend().model, {}, []
+    for text in texts:
+        k = seen[text] = seen.get(text, -1) + 1
+        out.append(str(uuid.uuid5(_POINT_NS, f"{doc_id}\0{model}\0{k}\0{text}")))
+    return out
+
+def make_payload(doc_id: str, text: str, meta: Dict, patient_nom: str | None, dim: int) -> Dict:
+    # payload minimal : le dossier complet est dans document_store (une fois par doc_id)
+    backend = get_backend()
+    return {
+        "doc_id": doc_id,
+        "text": text,
+        "section": meta.get("section"),
+        "patient_nom": patient_nom,
+        "meta": meta,
+        "provider": backend.name,
+        "embed_model": backend.model,
+        "embed_dim": dim,
+    }
+
+def make_point(pid: str, doc_id: str, text: str, vector: List[float], meta: Dict,
+               patient_nom: str | None = None) -> "PointStruct":
+    return _models().PointStruct(id=pid, vector=vector, payload=make_payload(doc_id, text, meta, patient_nom, len(vector)))
+
+def make_points(doc_id: str, texts: List[str], vectors: List[List[float]], metas: List[Dict],
+                patient_nom: str | None = None) -> List["PointStruct"]:
+    return [make_point(pid, doc_id, text, vec, meta, patient_nom)
+            for pid, vec, text, meta in zip(passage_ids(doc_id, texts), vectors, texts, metas)]
+
+def upsert_points(points: List["PointStruct"], wait: bool = True) -> int:
+    # wait=False : Qdrant accuse réception sans attendre l'application (gros imports)
+    with timed("upsert"):
+        get_qdrant_client().upsert(collection_name=active_collection(), points=points, wait=wait)
     return len(points)
 
-def knn_search(query_vec: List[float], top_k: int = 5, doc_id: str | None = None):
-    flt = None
-    if doc_id:
-        flt = Filter(must=[FieldCondition(key="doc_id", match=MatchValue(value=doc_id))])
-    res = client.search(
-        collection_name=COLLECTION,
+def upsert_passages(doc_id: str, texts: List[str], vectors: List[List[float]], metas: List[Dict],
+                    patient_nom: str | None = None):
+    return upsert_points(make_points(doc_id, texts, vectors, metas, patient_nom))
+
+# ─────────────────────────────
+# Ré-indexation incrémentale : diff avec les points déjà stockés
+# ─────────────────────────────
+def collection_exists(collection: str | None = None) -> bool:
+    # une collection vérifiée par ensure_collection existe : pas d'appel réseau
+    collection = collection or active_collection()
+    return collection in _collections or get_qdrant_client().collection_exists(collection)
+
+def collection_dimension(collection: str | None = None) -> int | None:
+    """Dimension des vecteurs de la collection (None si elle n'existe pas encore)."""
+    collection = collection or active_collection()
+    if collection in _collections:
+        return _collections[collection]
+    client = get_qdrant_client()
+    if not client.collection_exists(collection):
+        return None
+    params = client.get_collection(collection).config.params.vectors
+    return None if isinstance(params, dict) else params.size
+
+def existing_points_many(doc_ids: List[str], page_size: int = 512) -> Dict[str, Dict[str, Dict]]:
+    """
+    {doc_id: {id: payload}} pour plusieurs documents : un seul scroll filtré
+    (MatchAny), sans les vecteurs. La collection doit exister (collection_exists).
+    """
+    out: Dict[str, Dict[str, Dict]] = {d: {} for d in doc_ids}
+    if not doc_ids:
+        return out
+    client, collection = get_qdrant_client(), active_collection()
+    m = _models()
+    flt = m.Filter(must=[m.FieldCondition(key="doc_id", match=m.MatchAny(any=list(doc_ids)))])
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection, scroll_filter=flt,
+                                       limit=page_size, offset=offset, with_payload=True, with_vectors=False)
+        for p in points:
+            payload = p.payload or {}
+            out.setdefault(payload.get("doc_id"), {})[str(p.id)] = payload
+        if offset is None:
+            return out
+
+def existing_points(doc_id: str, page_size: int = 512) -> Dict[str, Dict]:
+    """{id: payload} des points d'un document (scroll filtré, sans les vecteurs)."""
+    if not collection_exists():
+        return {}
+    return existing_points_many([doc_id], page_size)[doc_id]
+
+def diff_passages(doc_id: str, texts: List[str], metas: List[Dict], patient_nom: str | None = None,
+                  existing: Dict[str, Dict] | None = None) -> Dict[str, Any]:
+    """
+    Compare les passages d'un dossier aux points existants :
+    - new : indices des passages à embedder et upserter (id absent) ;
+    - payloads : {id: payload} texte identique mais métadonnées changées
+      (ex. position idx décalée) → réécrites sans ré-embedding ;
+    - removed : ids qui ne correspondent plus à aucun passage ;
+    - unchanged : nombre de points conservés tels quels.
+    `existing` : points déjà lus (existing_points_many), sinon un scroll.
+    """
+    ids = passage_ids(doc_id, texts)
+    if existing is None:
+        existing = existing_points(doc_id)
+    new, payloads, unchanged = [], {}, 0
+    for k, (pid, text, meta) in enumerate(zip(ids, texts, metas)):
+        old = existing.get(pid)
+        if old is None:
+            new.append(k)
+            continue
+        expected = make_payload(doc_id, text, meta, patient_nom, old.get("embed_dim"))
+        if old != expected:
+            payloads[pid] = expected
+        else:
+            unchanged += 1
+    keep = set(ids)
+    return {"ids": ids, "new": new, "payloads": payloads, "unchanged": unchanged,
+            "removed": [pid for pid in existing if pid not in keep],
+            "dimension": next((p.get("embed_dim") for p in existing.values()), None)}
+
+def apply_diffs(diffs: List[Dict[str, Any]], wait: bool = True) -> None:
+    """Réécrit les payloads modifiés et supprime les points retirés de plusieurs diffs, en une requête batch."""
+    m = _models()
+    ops = [m.OverwritePayloadOperation(overwrite_payload=m.SetPayload(payload=payload, points=[pid]))
+           for diff in diffs for pid, payload in diff["payloads"].items()]
+    removed = [pid for diff in diffs for pid in diff["removed"]]
+    if removed:
+        ops.append(m.DeleteOperation(delete=m.PointIdsList(points=removed)))
+    if not ops:
+        return
+    with timed("upsert"):
+        get_qdrant_client().batch_update_points(collection_name=active_collection(), update_operations=ops, wait=wait)
+
+def apply_diff(diff: Dict[str, Any], wait: bool = True) -> None:
+    apply_diffs([diff], wait)
+
+def _filter(doc_id: str | None = None, section: str | None = None, patient_nom: str | None = None):
+    m = _models()
+    must = [m.FieldCondition(key=k, match=m.MatchValue(value=v))
+            for k, v in (("doc_id", doc_id), ("section", section), ("patient_nom", patient_nom)) if v]
+    return m.Filter(must=must) if must else None
+
+def hydrate_hits(hits):
+    """Ajoute payload["raw_json"] aux résultats, chaque dossier n'étant lu qu'une fois."""
+    records = document_store.get_many(h.payload.get("doc_id") for h in hits if h.payload)
+    for h in hits:
+        if h.payload:
+            h.payload["raw_json"] = records.get(h.payload.get("doc_id"))
+    return hits
+
+def knn_search(query_vec: List[float], top_k: int = 5, doc_id: str | None = None,
+               section: str | None = None, patient_nom: str | None = None, hydrate: bool = False):
+    res = get_qdrant_client().search(
+        collection_name=active_collection(),
         query_vector=query_vec,
         limit=top_k,
         with_payload=True,
-        query_filter=flt
+        query_filter=_filter(doc_id, section, patient_nom)
     )
-    return res
+    return hydrate_hits(res) if hydrate else res
+
+def knn_search_batch(query_vecs: List[List[float]], top_k: int | List[int] = 5,
+                     filters: Optional[List[Dict]] = None):
+    """
+    Plusieurs recherches en un aller-retour (search_batch).
+    top_k : commun ou un par requête ; filters[i] = {doc_id, section, patient_nom}.
+    """
+    top_ks = top_k if isinstance(top_k, list) else [top_k] * len(query_vecs)
+    filters = filters or [{}] * len(query_vecs)
+    requests = [
+        _models().SearchRequest(vector=vec, limit=k, with_payload=True, filter=_filter(**flt))
+        for vec, k, flt in zip(query_vecs, top_ks, filters)
+    ]
+    return get_qdrant_client().search_batch(collection_name=active_collection(), requests=requests)
@@ -1,15 +1,37 @@
-from pydantic import BaseModel
+from pydantic import AliasChoices, BaseModel, Field
 from pydantic_settings import BaseSettings
-from pathlib import Path
 import os
 
 class Settings(BaseSettings):
-    # API provider: 'mistral_api' (par défaut ici)
+    # API provider: 'mistral_api' (par défaut ici) | 'local' (app/infer.py via le micro-batching de app/scheduler.py)
     provider: str = "mistral_api"
 
     # Mistral Cloud
     mistral_api_key: str | None = None
     mistral_model_name: str = "mistral-medium"  # tiny | small | medium
+    mistral_max_concurrency: int = 64   # appels LLM simultanés (semaphore)
+    mistral_max_connections: int = 100  # pool HTTP keep-alive
+    mistral_timeout_s: float = 120.0
+    mistral_server_url: str | None = None  # autre endpoint compatible (bench local) ; None = API Mistral
+
+    # Inférence locale (app/infer.py, transformers)
+    model_name: str = "microsoft/Phi-3-mini-4k-instruct"
+    model_local_dir: str | None = None   # dossier local prioritaire sur le Hub
+    use_4bit: bool = False
+    top_p: float = 0.9
+    use_prefix_cache: bool = True        # KV du préambule statique calculé une seule fois
+    constrained_decoding: bool = False   # tokens restreints au schéma, arrêt à la fermeture du JSON
+    gen_batch_max_size: int = 8          # micro-batching (app/scheduler.py) : documents par generate
+    gen_batch_wait_ms: float = 20.0      # attente max pour compléter un lot
+
+    # Qdrant
+    qdrant_host: str | None = None  # URL (https://...:6333) ; ":memory:" = base locale en mémoire
+    qdrant_port: int = 6333
+    qdrant_collection: str = "medical_records"
+    qdrant_api_key: str | None = Field(None, validation_alias=AliasChoices("qdrant_api_key", "api_key"))
+
+    # Démarrage : warmup optionnel (schéma, prompts, connexions) pendant le lifespan
+    warmup_on_startup: bool = False
 
     # Chemins
     schema_path: str = "docs/schemas/medical_record_schema.json"
@@ -18,12 +40,67 @@ class Settings(BaseSettings):
     # Génération
     temperature: float = 0.0
     max_new_tokens: int = 1200
+    prompt_variant: str = "full"  # full | compact | condensed (voir services/prompts.py)
+
+    # Extraction PDF (pool de processus)
+    pdf_workers: int = 0              # 0 = nombre de CPU
+    pdf_pages_per_task: int = 8       # pages par tâche envoyée au pool
+    pdf_parallel_min_pages: int = 16  # en dessous : extraction séquentielle
+
+    # Documents longs : découpage + extraction parallèle + fusion
+    long_doc_threshold_tokens: int = 6000  # au-delà : mode map-reduce automatique
+    chunk_max_tokens: int = 3000
+    chunk_overlap_tokens: int = 200
+
+    # Traitement par lots (/extract-batch)
+    batch_max_parallel: int = 8  # documents traités en parallèle par lot
+
+    # Uploads
+    max_upload_bytes: int = 50 * 1024 * 1024         # par PDF
+    max_batch_upload_bytes: int = 500 * 1024 * 1024  # corps complet de /extract-batch
+
+    # Cache des extractions (LRU mémoire + disque sous outputs_dir/cache)
+    cache_enabled: bool = True
+    cache_max_entries: int = 512
+    cache_max_disk_entries: int = 10000
+    cache_ttl_seconds: int = 7 * 24 * 3600  # 0 = pas d'expiration
+
+    # Backend d'embedding : 'mistral' (API) | 'local' (hors ligne, n-grammes hachés)
+    embed_backend: str = "mistral"
+    local_embed_dim: int = 512
+
+    # Embeddings Mistral (requêtes par lots, en parallèle, avec reprises)
+    mistral_embed_model: str = "mistral-embed"
+    mistral_embed_url: str = "https://api.mistral.ai/v1/embeddings"
+    embed_batch_size: int = 64            # textes max par requête
+    embed_batch_max_tokens: int = 8000    # tokens estimés max par requête
+    embed_max_parallel: int = 4           # requêtes simultanées (= taille du pool HTTP)
+    embed_max_retries: int = 5            # reprises sur 429 / 5xx / erreur réseau
+    embed_timeout_s: float = 60.0
+
+    # Indexation en masse (/index-batch) : pipeline passages → embeddings → upserts
+    index_embed_batch: int = 256     # passages par lot d'embedding
+    index_upsert_batch: int = 1024   # points par upsert Qdrant
+    index_queue_size: int = 4        # lots en attente entre deux étapes
+
+    # Recherche sémantique (/search)
+    search_query_cache_entries: int = 1024  # embeddings de requêtes gardés en mémoire (LRU)
+    search_max_top_k: int = 100
+
+    # Cache des embeddings (float32 memmap sous outputs_dir/embeddings_cache)
+    embed_cache_enabled: bool = True
+
+    # Jobs asynchrones (/jobs) : file SQLite persistante sous outputs_dir/jobs
+    jobs_workers: int = 2            # workers par processus API ; 0 = soumission seule
+    jobs_max_attempts: int = 3
+    jobs_retry_base_s: float = 5.0   # backoff exponentiel entre deux tentatives
+    jobs_lease_s: float = 60.0       # job "running" sans heartbeat au-delà : repris (crash, redémarrage)
+
+    # Métriques (/metrics au format Prometheus + en-tête Server-Timing) ; False = instrumentation no-op
+    metrics_enabled: bool = True
 
     class Config:
         env_file = ".env"
         extra = "allow"
 
 settings = Settings()
-
-# Micro-check pour le dossier outputs
-Path(settings.outputs_dir).mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,22 @@
+# Lecture des uploads (partagée par les routers extract et jobs)
+from fastapi import HTTPException, UploadFile
+from .settings import settings
+
+UPLOAD_CHUNK = 1024 * 1024
+
+async def upload_size(file: UploadFile) -> int:
+    if file.size is None:
+        await file.seek(0, 2)
+        file.size = file.file.tell()
+    await file.seek(0)
+    return file.size
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Lit un upload par blocs en s'arrêtant dès que la taille max est dépassée."""
+    buf = bytearray()
+    await file.seek(0)
+    while chunk := await file.read(UPLOAD_CHUNK):
+        buf += chunk
+        if len(buf) > settings.max_upload_bytes:
+            raise HTTPException(status_code=413, detail=f"Fichier trop volumineux (max {settings.max_upload_bytes} octets).")
+    return bytes(buf)
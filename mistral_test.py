@@ -4,7 +4,6 @@ import re
 from datetime import datetime
 from pathlib import Path
 
-import pdfplumber
 from jsonschema import validate, ValidationError
 from mistralai import Mistral
 
@@ -36,17 +35,9 @@ LOGS_DIR.mkdir(parents=True, exist_ok=True)
 # ─────────────────────────────────────────────
 # 2. Extraction de texte PDF
 # ─────────────────────────────────────────────
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """
-    Extraction simple avec pdfplumber.
-    (Pour les PDFs scannés/vides, ajoute un fallback OCR plus tard.)
-    """
-    text_parts = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            t = page.extract_text() or ""
-            text_parts.append(t)
-    return "\n".join(text_parts).strip()
+# Même chemin que l'API (pages en parallèle au-delà de PDF_PARALLEL_MIN_PAGES)
+# pour que les mesures de ce script correspondent à la production.
+from app.services.pdf_text import extract_text_from_pdf
 
 # ─────────────────────────────────────────────
 # 3. Construction du prompt (avec schéma)
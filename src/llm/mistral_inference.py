@@ -1,11 +1,17 @@
-import torch, json, re
+import sys, torch, json, re
 from datetime import datetime
+from pathlib import Path
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     BitsAndBytesConfig,
+    LogitsProcessorList,
+    StoppingCriteriaList,
 )
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.constrained import SchemaConstraint
+
 # ---------- Configuration modèle ----------
 # MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.2"
 MODEL_NAME = "microsoft/Phi-3-mini-4k-instruct"   # 3.8 B → ~2 Go
@@ -30,6 +36,10 @@ model = AutoModelForCausalLM.from_pretrained(
 if tok.pad_token is None:
     tok.pad_token = tok.eos_token
 
+# Décodage contraint par le schéma (tokens hors JSON valide interdits)
+SCHEMA_PATH = "docs/schemas/medical_record_schema.json"
+constraint = SchemaConstraint.from_schema_file(tok, SCHEMA_PATH)
+
 # ---------- Construction du prompt ----------
 today = datetime.now().strftime("%Y-%m-%d")
 
@@ -69,7 +79,7 @@ Réponds par le JSON uniquement.
 [/INST]"""
 
 # ---------- Génération ----------
-def generate_json_from_text(raw_text: str, max_new_tokens=1200):
+def generate_json_from_text(raw_text: str, max_new_tokens=1200, constrained=True):
     messages = [
         {"role": "system", "content": "Tu es un extracteur clinique."},
         {"role": "user", "content": build_prompt(raw_text)},
@@ -78,6 +88,12 @@ def generate_json_from_text(raw_text: str, max_new_tokens=1200):
     prompt_text = tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
     inputs = tok(prompt_text, return_tensors="pt").to(model.device)
 
+    extra = {}
+    if constrained:
+        # ➜ s'arrête dès que l'objet JSON racine est refermé
+        proc, stop = constraint.processors()
+        extra = {"logits_processor": LogitsProcessorList([proc]), "stopping_criteria": StoppingCriteriaList([stop])}
+
     with torch.inference_mode():
         out_ids = model.generate(
             **inputs,
@@ -85,6 +101,7 @@ def generate_json_from_text(raw_text: str, max_new_tokens=1200):
             temperature=0.1,
             top_p=0.9,
             do_sample=False,
+            **extra,
         )
 
     # ➜ On retire les tokens du prompt (pour ne garder que la sortie)
@@ -0,0 +1,404 @@
+"""
+Benchmark de bout en bout, hors ligne :
+1) génère des PDFs médicaux synthétiques multi-pages (français, taille réglable) ;
+2) démarre l'API (uvicorn, dans ce processus) avec Qdrant en mémoire et un
+   faux serveur Mistral local (chat + embeddings, latence réglable) ;
+3) envoie les PDFs à /extract-file puis les dossiers extraits à /index-json,
+   puis ré-indexe ces dossiers « ré-extraits » (sans id_document, autre date
+   et autre modèle dans meta) : aucun passage ne doit être ajouté ni supprimé ;
+4) rapporte débit, latences p50/p95/p99 (totales et par étape, lues dans
+   l'en-tête Server-Timing) et pic de RSS par phase ;
+5) enregistre le tout en JSON (bench_results/, ignoré par git) pour comparer deux commits.
+
+Usage (depuis la racine du dépôt) :
+  python src/test/bench_e2e.py --docs 40 --pages 6 --concurrency 8 --llm-latency-ms 300
+  python src/test/bench_e2e.py --compare bench_results/e2e-<ancien>.json
+Le pic de RSS couvre tout le processus (API + faux serveur + client de charge).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+MARKER = re.compile(r"Dossier BENCH-(\d{5})")
+
+# --- 1. Dossiers et PDFs synthétiques ---
+PRENOMS = ["Jean", "Marie", "Luc", "Camille", "Hélène", "François", "Amélie", "Jérôme", "Zoé", "Noël"]
+NOMS = ["Dupont", "Martin", "Lefèvre", "Moreau", "Girard", "Bérenger", "Rousseau", "Chevalier", "Gauthier", "Perrin"]
+MALADIES = ["Hypertension artérielle", "Diabète de type 2", "Asthme", "Hypothyroïdie", "Fibrillation auriculaire",
+            "Dyslipidémie", "Gastro-entérite", "Lombalgie chronique", "Migraine", "BPCO"]
+MEDICAMENTS = [("Amlodipine", "5 mg"), ("Metformine", "1000 mg"), ("Salbutamol", "100 µg"), ("Lévothyroxine", "75 µg"),
+               ("Apixaban", "5 mg"), ("Atorvastatine", "20 mg"), ("Paracétamol", "1 g"), ("Oméprazole", "20 mg")]
+MOTIFS = ["Contrôle tensionnel", "Renouvellement d'ordonnance", "Douleurs thoraciques atypiques", "Toux persistante",
+          "Bilan annuel", "Fatigue et essoufflement", "Céphalées", "Suivi glycémique"]
+OBSERVATIONS = ["Examen clinique sans particularité, auscultation cardio-pulmonaire normale.",
+                "TA 14/9 au repos, pas d'œdème des membres inférieurs, pouls régulier.",
+                "Patient(e) apyrétique, abdomen souple et indolore, transit conservé.",
+                "Sibilants diffus à l'auscultation, saturation 96 % en air ambiant.",
+                "Glycémie capillaire à 1,32 g/L, HbA1c en légère baisse par rapport au dernier bilan."]
+
+def _date(rng: random.Random, y0: int = 2015, y1: int = 2024) -> str:
+    return f"{rng.randint(y0, y1)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+def make_record(i: int, pages: int, rng: random.Random) -> dict:
+    """Dossier conforme au schéma ; ~6 consultations par page de PDF."""
+    maladies = rng.sample(MALADIES, 3)
+    traitements = rng.sample(MEDICAMENTS, 3)
+    return {
+        "patient": {"id": f"BENCH-{i:05d}", "nom": f"{rng.choice(PRENOMS)} {rng.choice(NOMS)}",
+                    "date_naissance": _date(rng, 1935, 2005), "sexe": rng.choice(["Masculin", "Féminin"]),
+                    "adresse": f"{rng.randint(1, 99)} rue des Lilas, 69003 Lyon"},
+        "antecedents_medicaux": [{"condition": m, "date_diagnostic": _date(rng, 2000, 2015), "status": "actif",
+                                  "type": "chronique", "gravite": "modérée"} for m in maladies],
+        "traitements_actuels": [{"medicament": m, "dose": d, "posologie": "1 prise par jour", "indication": maladies[k],
+                                 "debut_traitement": _date(rng, 2015, 2020), "fin_traitement": None}
+                                for k, (m, d) in enumerate(traitements)],
+        "consultations": [{"date": _date(rng), "motif": rng.choice(MOTIFS), "observations": rng.choice(OBSERVATIONS),
+                           "diagnostic": rng.choice(maladies), "traitement_prescrit": f"Poursuite {rng.choice(traitements)[0]}"}
+                          for _ in range(6 * pages)],
+        "examens": [{"date": _date(rng), "type": "Bilan sanguin", "resultat": "Ionogramme normal, créatinine 78 µmol/L"}],
+        "resume_structure": {"maladies": [{"nom": m, "premiere_mention": _date(rng, 2000, 2015), "statut": "active",
+                                           "confiance": 0.9} for m in maladies],
+                             "allergies": ["Pénicilline"], "traitements": [m for m, _ in traitements]},
+        "meta": {"langue": "fr", "source": "pdf", "date_extraction": datetime.now().strftime("%Y-%m-%d"),
+                 "modele_utilise": "bench-fake", "confiance_moyenne": 0.9, "schema_version": "1.0"},
+        "document_source": {"nom_fichier": f"bench_{i:05d}.pdf", "type": "pdf", "id_document": f"BENCH-{i:05d}"},
+    }
+
+def record_lines(i: int, rec: dict) -> list:
+    p = rec["patient"]
+    lines = [f"Dossier BENCH-{i:05d} - Compte rendu médical", "",
+             f"Patient : {p['nom']}, né(e) le {p['date_naissance']}, sexe {p['sexe']}.", f"Adresse : {p['adresse']}", "",
+             "Antécédents :"]
+    lines += [f"- {a['condition']} diagnostiqué(e) le {a['date_diagnostic']} ({a['gravite']})." for a in rec["antecedents_medicaux"]]
+    lines += ["", "Traitements en cours :"]
+    lines += [f"- {t['medicament']} {t['dose']}, {t['posologie']}, depuis le {t['debut_traitement']}." for t in rec["traitements_actuels"]]
+    lines += ["", "Allergies : pénicilline.", ""]
+    for c in rec["consultations"]:
+        lines += [f"Consultation du {c['date']} - motif : {c['motif']}.", f"  {c['observations']}",
+                  f"  Diagnostic : {c['diagnostic']}. {c['traitement_prescrit']}.", ""]
+    return lines
+
+def _pdf_str(line: str) -> bytes:
+    raw = line.encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def make_pdf(i: int, lines: list, lines_per_page: int = 60) -> bytes:
+    """PDF 1.4 minimal (Helvetica, WinAnsi), sans dépendance : lisible par pdfplumber."""
+    pages = [lines[k:k + lines_per_page] for k in range(0, len(lines), lines_per_page)] or [[]]
+    n = len(pages)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [" + b" ".join(f"{4 + 2 * k} 0 R".encode() for k in range(n))
+               + f"] /Count {n} >>".encode(),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    for k, page in enumerate(pages):
+        header = f"Dossier BENCH-{i:05d} - page {k + 1}/{n}"  # marqueur répété : retrouvé dans chaque chunk
+        body = b"BT /F1 9 Tf 12 TL 40 805 Td " + _pdf_str(header) + b" Tj T* T*"
+        body += b"".join(b" " + _pdf_str(line) + b" Tj T*" for line in page) + b" ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       f"/Contents {5 + 2 * k} 0 R >>".encode())
+        objects.append(f"<< /Length {len(body)} >>\nstream\n".encode() + body + b"\nendstream")
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for num, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+# --- 2. Faux serveur Mistral (chat + embeddings) ---
+class FakeMistral(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, comme l'API réelle
+    records: dict = {}
+    llm_latency_s = 0.2
+    embed_latency_s = 0.03
+    dim = 64
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: dict):
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/chat/completions"):
+            return self._chat(payload)
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(payload)
+        self._send(404, {"message": "not found"})
+
+    def _chat(self, payload: dict):
+        time.sleep(self.llm_latency_s)
+        prompt = payload["messages"][-1]["content"]
+        m = MARKER.search(prompt)
+        rec = self.records.get(int(m.group(1))) if m else None
+        rec = rec or next(iter(self.records.values()))
+        content = "```json\n" + json.dumps(rec, ensure_ascii=False) + "\n```"
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self._send(200, {"id": "bench", "object": "chat.completion", "model": payload["model"],
+                         "created": int(time.time()), "usage": usage,
+                         "choices": [{"index": 0, "finish_reason": "stop",
+                                      "message": {"role": "assistant", "content": content}}]})
+
+    def _embeddings(self, payload: dict):
+        time.sleep(self.embed_latency_s)
+        data = []
+        for k, text in enumerate(payload["input"]):
+            rng = random.Random(text)
+            data.append({"object": "embedding", "index": k, "embedding": [rng.uniform(-1, 1) for _ in range(self.dim)]})
+        self._send(200, {"id": "bench", "object": "list", "model": payload["model"], "data": data,
+                         "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_fake_mistral() -> tuple:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMistral)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def start_api(port: int):
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Échec du démarrage de l'API (voir les logs uvicorn).")
+        time.sleep(0.02)
+    return server, thread
+
+# --- 3. Mesures ---
+def reset_peak_rss() -> None:
+    try:  # Linux : remet VmHWM à la RSS courante → pic propre à chaque phase
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+def peak_rss_mb() -> float:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # pic depuis le démarrage
+
+def percentile(values: list, q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)  # rang le plus proche
+    return round(ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)], 1)
+
+def summarize(values: list) -> dict:
+    return {"n": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "max": round(max(values), 1) if values else None}
+
+def parse_server_timing(header: str) -> dict:
+    out = {}
+    for part in filter(None, (p.strip() for p in header.split(","))):
+        name, _, dur = part.partition(";dur=")
+        if dur:
+            out[name] = float(dur)
+    return out
+
+def run_phase(name: str, send, items: list, concurrency: int) -> tuple[dict, list]:
+    """Envoie `items` avec `concurrency` clients ; latences client + Server-Timing par étape."""
+    latencies, stages, errors, results = [], {}, [], [None] * len(items)
+    lock = threading.Lock()
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def one(k: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            r = send(session, items[k])
+            ms = (time.perf_counter() - t0) * 1000
+            r.raise_for_status()
+        except Exception as e:
+            with lock:
+                errors.append(str(e)[:200])
+            return
+        with lock:
+            latencies.append(ms)
+            results[k] = r.json()
+            for stage, dur in parse_server_timing(r.headers.get("server-timing", "")).items():
+                stages.setdefault(stage, []).append(dur)
+
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(len(items))))
+    wall = time.perf_counter() - t0
+    session.close()
+    report = {
+        "requests": len(items), "errors": len(errors), "error_samples": errors[:3],
+        "concurrency": concurrency, "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {stage: summarize(v) for stage, v in sorted(stages.items())},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    return report, results
+
+def print_phase(name: str, rep: dict) -> None:
+    lat = rep["latency_ms"]
+    print(f"\n⏱️  {name} : {rep['requests']} requêtes, concurrence {rep['concurrency']}, "
+          f"{rep['throughput_per_s']} req/s, {rep['errors']} erreur(s), pic RSS {rep['peak_rss_mb']} Mo")
+    print(f"   {'étape':<12} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+    for stage, s in [("requête", lat)] + list(rep["stages_ms"].items()):
+        print(f"   {stage:<12} {s['p50'] or 0:9.1f} {s['p95'] or 0:9.1f} {s['p99'] or 0:9.1f}")
+
+def compare(current: dict, baseline_path: Path) -> None:
+    base = json.loads(baseline_path.read_text(encoding="utf-8"))
+    print(f"\n📊 Comparaison avec {baseline_path.name} ({base.get('git_commit')})")
+    for phase, rep in current["phases"].items():
+        old = base.get("phases", {}).get(phase)
+        if not old:
+            continue
+        for label, new_v, old_v in (("débit /s", rep["throughput_per_s"], old["throughput_per_s"]),
+                                    ("p50 ms", rep["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+                                    ("p95 ms", rep["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+                                    ("pic RSS Mo", rep["peak_rss_mb"], old["peak_rss_mb"])):
+            if new_v is not None and old_v:
+                print(f"   {phase:<12} {label:<10} {old_v:10.1f} → {new_v:10.1f}  ({(new_v - old_v) / old_v * 100:+.1f} %)")
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# --- 4. Exécution ---
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark e2e hors ligne (/extract-file, /index-json)")
+    p.add_argument("--docs", type=int, default=20, help="nombre de PDFs")
+    p.add_argument("--pages", type=int, default=4, help="pages par PDF (~6 consultations par page)")
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--llm-latency-ms", type=float, default=200.0)
+    p.add_argument("--embed-latency-ms", type=float, default=30.0)
+    p.add_argument("--embed-dim", type=int, default=64)
+    p.add_argument("--warmup", type=int, default=1, help="documents envoyés avant mesure (pools, clients, collection)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", type=Path, default=ROOT / "bench_results")
+    p.add_argument("--compare", type=Path, help="résultat JSON d'un autre commit à comparer")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng = random.Random(args.seed)
+    config = {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}
+
+    reset_peak_rss()
+    t0 = time.perf_counter()
+    records = {i: make_record(i, args.pages, rng) for i in range(args.docs)}
+    pdfs = {i: make_pdf(i, record_lines(i, rec)) for i, rec in records.items()}
+    gen_s = time.perf_counter() - t0
+    total_kb = sum(len(p) for p in pdfs.values()) / 1024
+    print(f"📄 {args.docs} PDFs × {args.pages} page(s) générés en {gen_s * 1000:.0f} ms ({total_kb:.0f} Ko au total)")
+
+    FakeMistral.records = records
+    FakeMistral.llm_latency_s = args.llm_latency_ms / 1000
+    FakeMistral.embed_latency_s = args.embed_latency_ms / 1000
+    FakeMistral.dim = args.embed_dim
+    fake, fake_url = start_fake_mistral()
+
+    # configuration lue par app.settings à l'import : à fixer avant de charger l'API
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    os.environ.update({
+        "MISTRAL_API_KEY": "bench", "MISTRAL_SERVER_URL": fake_url, "MISTRAL_EMBED_URL": f"{fake_url}/v1/embeddings",
+        "EMBED_BACKEND": "mistral", "QDRANT_HOST": ":memory:", "OUTPUTS_DIR": workdir,
+        "CACHE_ENABLED": "false", "EMBED_CACHE_ENABLED": "false", "METRICS_ENABLED": "true",
+        "WARMUP_ON_STARTUP": "false",
+    })
+    port = free_port()
+    api, api_thread = start_api(port)
+    base = f"http://127.0.0.1:{port}"
+    print(f"🚀 API sur {base}, faux Mistral sur {fake_url} (LLM {args.llm_latency_ms:.0f} ms, "
+          f"embeddings {args.embed_latency_ms:.0f} ms), Qdrant en mémoire")
+
+    for i in list(pdfs)[:args.warmup]:  # hors mesure : pool PDF, clients HTTP, collection Qdrant
+        r = requests.post(f"{base}/extract-file", files={"file": (f"bench_{i:05d}.pdf", pdfs[i], "application/pdf")}, timeout=600)
+        requests.post(f"{base}/index-json", json=r.json()["json"], timeout=600)
+
+    phases = {}
+    extract_rep, extracted = run_phase(
+        "extract-file",
+        lambda s, i: s.post(f"{base}/extract-file", files={"file": (f"bench_{i:05d}.pdf", pdfs[i], "application/pdf")},
+                            timeout=600),
+        list(pdfs), args.concurrency)
+    extract_rep["valid"] = sum(1 for r in extracted if r and r.get("valid"))
+    phases["extract-file"] = extract_rep
+    print_phase("/extract-file", extract_rep)
+    print(f"   dossiers valides : {extract_rep['valid']}/{args.docs}")
+
+    docs = [r["json"] for r in extracted if r and r.get("json")] or list(records.values())
+    index_rep, indexed = run_phase(
+        "index-json", lambda s, doc: s.post(f"{base}/index-json", json=doc, timeout=600), docs, args.concurrency)
+    index_rep["passages"] = sum(r["inserted"] for r in indexed if r)
+    phases["index-json"] = index_rep
+    print_phase("/index-json", index_rep)
+    print(f"   passages indexés : {index_rep['passages']}")
+
+    # même PDF ré-extrait un autre jour / par un autre modèle, sans id_document :
+    # le doc_id (hash du contenu hors meta) doit rester le même
+    post_index = lambda s, doc: s.post(f"{base}/index-json", json=doc, timeout=600)
+    sans_id = [{**d, "document_source": {**(d.get("document_source") or {}), "id_document": None}} for d in docs]
+    run_phase("index-json", post_index, sans_id, args.concurrency)
+    reextracted = [{**d, "meta": {**(d.get("meta") or {}), "date_extraction": "2099-01-01",
+                                  "modele_utilise": "autre-modele"}} for d in sans_id]
+    reindex_rep, reindexed = run_phase("reindex-json", post_index, reextracted, args.concurrency)
+    reindex_rep["inserted"] = sum(r["inserted"] for r in reindexed if r)
+    reindex_rep["deleted"] = sum(r["deleted"] for r in reindexed if r)
+    phases["reindex-json"] = reindex_rep
+    print_phase("/index-json (ré-extraction)", reindex_rep)
+    ok = reindex_rep["inserted"] == 0 and reindex_rep["deleted"] == 0 and not reindex_rep["errors"]
+    print(f"   passages ajoutés : {reindex_rep['inserted']}, supprimés : {reindex_rep['deleted']} "
+          f"{'✅' if ok else '❌ doublons ou pertes'}")
+
+    api.should_exit = True
+    api_thread.join(timeout=10)
+    fake.shutdown()
+
+    result = {"git_commit": git_commit(), "date": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "config": config,
+              "generate": {"seconds": round(gen_s, 3), "pdf_kb": round(total_kb, 1)}, "phases": phases}
+    args.out.mkdir(parents=True, exist_ok=True)
+    out_file = args.out / f"e2e-{result['git_commit'] or 'nogit'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out_file.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n💾 Résultats : {out_file}")
+    if args.compare:
+        compare(result, args.compare)
@@ -0,0 +1,135 @@
+"""
+Test + benchmark de app.services.embeddings.EmbeddingsClient contre un serveur
+local de substitution (aucun appel réseau externe) :
+- réponses 429 (avec Retry-After) et 503 aléatoires, latence simulée ;
+- `data` renvoyé dans le désordre (champ index) ;
+- vérifie l'ordre des vecteurs, le découpage en lots et les reprises ;
+- compare avec l'ancien appel unique requests.post (sans session ni reprise).
+
+Usage (depuis la racine du dépôt) : python src/test/bench_embeddings_client.py [n_textes]
+"""
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.services.embeddings import EmbeddingsClient
+
+DIM = 8
+LATENCY_S = 0.02
+
+# --- 1. Serveur de substitution ---
+def fake_vector(text: str) -> list:
+    h = zlib.crc32(text.encode("utf-8"))
+    return [float((h >> (4 * k)) & 0xF) for k in range(DIM)]
+
+class FakeEmbeddings(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    error_rate = 0.0
+    rng = random.Random(0)
+    lock = threading.Lock()
+    stats = {"requests": 0, "errors": 0, "max_batch": 0}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict | None = None):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path != "/v1/embeddings":
+            return self._send(404, {"message": "not found"})
+        time.sleep(LATENCY_S)
+        cls = type(self)
+        with cls.lock:
+            cls.stats["requests"] += 1
+            cls.stats["max_batch"] = max(cls.stats["max_batch"], len(payload["input"]))
+            roll = cls.rng.random()
+        if roll < cls.error_rate:
+            with cls.lock:
+                cls.stats["errors"] += 1
+            if roll < cls.error_rate / 2:
+                return self._send(429, {"message": "rate limited"}, {"Retry-After": "0"})
+            return self._send(503, {"message": "unavailable"})
+        data = [{"object": "embedding", "embedding": fake_vector(t), "index": i}
+                for i, t in enumerate(payload["input"])]
+        cls.rng.shuffle(data)
+        self._send(200, {"data": data, "model": payload["model"]})
+
+def start_server() -> tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/embeddings"
+
+# --- 2. Ancienne implémentation (référence) ---
+def legacy_embed(url: str, texts: list) -> list:
+    r = requests.post(url, headers={"Authorization": "Bearer test"},
+                      json={"model": "mistral-embed", "input": texts}, timeout=60)
+    if r.status_code != 200:
+        raise RuntimeError(f"Mistral embeddings error {r.status_code}: {r.text}")
+    return [d["embedding"] for d in r.json()["data"]]
+
+def make_client(url: str, **kw) -> EmbeddingsClient:
+    kw = {"batch_size": 32, "batch_max_tokens": 2000, "max_parallel": 4,
+          "max_retries": 6, "backoff_base_s": 0.01, "backoff_max_s": 0.1, **kw}
+    return EmbeddingsClient(url, "test", "mistral-embed", **kw)
+
+# --- 3. Exactitude ---
+def check(url: str, n: int) -> None:
+    rng = random.Random(1)
+    texts = [f"Consultation {i} : " + "observation " * rng.randint(1, 200) for i in range(n)]
+    FakeEmbeddings.error_rate = 0.3
+    client = make_client(url)
+    vectors = client.embed(texts)
+    assert vectors == [fake_vector(t) for t in texts], "ordre des vecteurs incorrect"
+    assert FakeEmbeddings.stats["max_batch"] <= 32
+    print(f"🧪 {n} textes → {len(client.batches(texts))} lots, "
+          f"{client.requests_sent} requêtes dont {client.retries} reprises "
+          f"({FakeEmbeddings.stats['errors']} erreurs simulées) : ordre OK")
+
+    # erreur non reprise : échec immédiat et explicite
+    bad = make_client(url.replace("/v1/embeddings", "/introuvable"))
+    FakeEmbeddings.error_rate = 0.0
+    try:
+        bad.embed(["x"])
+    except RuntimeError as e:
+        print(f"🧪 Erreur non reprise remontée : {str(e)[:60]}")
+    client.close()
+    bad.close()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    server, url = start_server()
+    check(url, n)
+
+    FakeEmbeddings.error_rate = 0.0
+    texts = [f"Traitement {i} : amlodipine 5 mg, 1 cp/jour." for i in range(n)]
+    t0 = time.perf_counter()
+    for start in range(0, n, 32):  # ancien code : une connexion TLS/TCP par appel
+        legacy_embed(url, texts[start:start + 32])
+    t_legacy = time.perf_counter() - t0
+
+    client = make_client(url)
+    t0 = time.perf_counter()
+    client.embed(texts)
+    t_new = time.perf_counter() - t0
+    client.close()
+    print(f"\n⏱️  {n} textes, lots de 32, latence serveur {LATENCY_S * 1000:.0f} ms")
+    print(f"   ancien (séquentiel, sans session) : {t_legacy * 1000:8.1f} ms")
+    print(f"   nouveau (pool de 4, keep-alive)   : {t_new * 1000:8.1f} ms  (x{t_legacy / t_new:.1f})")
+    server.shutdown()
@@ -0,0 +1,175 @@
+"""
+Fuzz + benchmark de app.services.json_extract.extract_json sur des sorties de
+modèle « sales » : prose autour, blocs ``` simples/doublés/non refermés,
+accolades et guillemets échappés dans les chaînes, sorties tronquées.
+Compare avec l'ancienne implémentation (une tentative json.loads par '{').
+
+Usage (depuis la racine du dépôt) : python src/test/bench_extract_json.py [n_cas]
+"""
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.services.json_extract import extract_json
+
+# --- 1. Ancienne implémentation (référence de vitesse) ---
+def legacy_extract_json(text: str) -> dict:
+    if not text or not text.strip():
+        raise ValueError("Réponse vide.")
+    m = re.search(r"```json\s*(\{.*?\})\s*```", text, flags=re.S | re.I)
+    if m:
+        return json.loads(m.group(1))
+    m = re.search(r"```\s*(\{.*?\})\s*```", text, flags=re.S)
+    if m:
+        return json.loads(m.group(1))
+    s = text
+    starts = [i for i, c in enumerate(s) if c == "{"]
+    for st in starts:
+        depth = 0
+        for j in range(st, len(s)):
+            ch = s[j]
+            if ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    try:
+                        return json.loads(s[st:j + 1])
+                    except json.JSONDecodeError:
+                        pass
+                    break
+    raise ValueError("Impossible d'extraire un JSON valide.")
+
+# --- 2. Générateur de sorties de modèle ---
+NASTY = ['{', '}', '"', '\\', '```', '{"a": 1}', 'é', '→', '\n', "l'patient", '}}', '{{']
+
+def rand_str(rng: random.Random) -> str:
+    parts = [rng.choice(["Doliprane", "HTA", "Suivi", "RAS", "1 g", "Dr. Martin"]) for _ in range(rng.randint(1, 3))]
+    if rng.random() < 0.5:
+        parts.insert(rng.randint(0, len(parts)), rng.choice(NASTY))
+    return " ".join(parts)
+
+def rand_record(rng: random.Random, n_items: int) -> dict:
+    return {
+        "patient": {"nom": rand_str(rng), "date_naissance": "1980-05-12", "sexe": "M", "adresse": None},
+        "consultations": [
+            {"date": f"2022-01-{1 + i % 28:02d}", "motif": rand_str(rng), "diagnostic": rand_str(rng)}
+            for i in range(n_items)
+        ],
+        "resume_structure": {"maladies": [{"nom": rand_str(rng), "confiance": round(rng.random(), 2)}],
+                             "allergies": [rand_str(rng)], "traitements": []},
+        "meta": {"langue": "fr", "date_extraction": "2024-01-01", "modele_utilise": "mistral-medium"},
+    }
+
+def wrap(rng: random.Random, payload: str) -> tuple[str, str]:
+    prose_before = rng.choice(["", "Voici le JSON demandé :\n", "Résultat {brouillon} :\n", 'Le "patient" :\n'])
+    prose_after = rng.choice(["", "\nJ'espère que cela aide !", "\nNote : {aucune}.", "\n```"])
+    kind = rng.choice(["brut", "fence_json", "fence", "double_fence", "fence_ouvert", "tronque"])
+    if kind == "brut":
+        out = prose_before + payload + prose_after
+    elif kind == "fence_json":
+        out = f"{prose_before}```json\n{payload}\n```{prose_after}"
+    elif kind == "fence":
+        out = f"{prose_before}```\n{payload}\n```{prose_after}"
+    elif kind == "double_fence":
+        out = f"{prose_before}```json\n```json\n{payload}\n```\n```{prose_after}"
+    elif kind == "fence_ouvert":
+        out = f"{prose_before}```json\n{payload}"
+    else:
+        out = prose_before + payload[: rng.randint(1, len(payload) - 1)]
+    return kind, out
+
+# --- 3. Fuzz : exactitude ---
+# cas fixes (régressions) : (sortie du modèle, résultat attendu ou None si ValueError)
+FIXED_CASES = [
+    ('ok {x} {"a":1}', {"a": 1}),  # objet de prose invalide près de la fin : pas « tronqué »
+    ('Résultat : {"a": {"b": 1}', None),
+    ('{"a": 1} et {"b": 2}', {"a": 1}),
+    ('{{"a":1}}', {"a": 1}),  # objet invalide : on cherche à l'intérieur
+    ('Réponse : {résultat : {"a": 1}}', {"a": 1}),
+    ('{ "patient": {"nom": "X"}, oops }', {"nom": "X"}),
+    ('{"a": [' * 2000, None),  # trop imbriqué : ValueError, pas RecursionError
+    ('{"a": ' * 5000 + "1" + "}" * 5000, None),
+    ("{" * 50_000, None),
+]
+
+def fixed_cases() -> int:
+    failures = 0
+    for text, expected in FIXED_CASES:
+        try:
+            got = extract_json(text)
+        except ValueError:
+            got = None
+        if got != expected:
+            failures += 1
+            print(f"❌ cas fixe {text!r} : {got!r} au lieu de {expected!r}")
+    return failures
+
+def fuzz(n_cases: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    failures = fixed_cases()
+    for _ in range(n_cases):
+        record = rand_record(rng, rng.randint(0, 5))
+        payload = json.dumps(record, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+        kind, out = wrap(rng, payload)
+        try:
+            got = extract_json(out)
+            ok = kind != "tronque" and got == record
+        except ValueError:
+            ok = kind == "tronque"
+        if not ok:
+            failures += 1
+            if failures <= 5:
+                print(f"❌ {kind}: {out[:200]!r}")
+    print(f"🧪 Fuzz : {n_cases + len(FIXED_CASES) - failures}/{n_cases + len(FIXED_CASES)} cas corrects "
+          f"(dont {len(FIXED_CASES)} cas fixes)")
+    if failures:
+        sys.exit(1)
+
+# --- 4. Benchmark : temps par taille de sortie ---
+def bench(fn, text: str, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            fn(text)
+        except ValueError:
+            pass
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+if __name__ == "__main__":
+    fuzz(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
+
+    rng = random.Random(1)
+    print("\n⏱️  ms (meilleur de 3)            ancien      nouveau")
+    for n_items in (10, 100, 1000):
+        payload = json.dumps(rand_record(rng, n_items), ensure_ascii=False)
+        size = f"{len(payload) // 1024} Ko"
+        cases = {
+            f"JSON nu ({size})": payload,
+            f"prose + JSON ({size})": "Voici {le résultat} :\n" + payload + "\nFin.",
+            f"```json ({size})": f"```json\n{payload}\n```\nFin.",
+            f"tronqué ({size})": payload[: len(payload) * 9 // 10],
+        }
+        for label, text in cases.items():
+            print(f"   {label:<30} {bench(legacy_extract_json, text):9.2f} {bench(extract_json, text):11.2f}")
+
+    # pire cas de l'ancienne version : chaque '{' de prose relance un balayage complet
+    payload = json.dumps(rand_record(rng, 100), ensure_ascii=False)
+    for n_braces in (100, 1000):
+        text = "{ " * n_braces + payload
+        label = f"{{ de prose ×{n_braces}"
+        print(f"   {label:<30} {bench(legacy_extract_json, text):9.2f} {bench(extract_json, text):11.2f}")
+
+    # linéarité : '{' répétés, objets invalides imbriqués ou côte à côte (nouvelle version seule)
+    print("\n⏱️  ms (meilleur de 3)            ×12,5k     ×200k    ratio")
+    patterns = {"{": "{", '{"a" ': '{"a" ', '{"a" x} ': '{"a" x} ', '{"a":1 ': '{"a":1 '}
+    for label, unit in patterns.items():
+        small, large = bench(extract_json, unit * 12_500), bench(extract_json, unit * 200_000)
+        label = f"{label!r} répété"
+        print(f"   {label:<30} {small:9.2f} {large:9.2f} {large / small:8.1f}")
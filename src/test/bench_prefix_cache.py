@@ -0,0 +1,56 @@
+"""
+Benchmark du cache KV de préfixe de app.infer.ModelWrapper (inférence locale) :
+- TTFT (temps jusqu'au premier token) = generate(max_new_tokens=1),
+  avec et sans réutilisation du préambule statique (règles + schéma) ;
+- vérifie que la sortie gloutonne est identique dans les deux modes.
+
+Usage (depuis la racine du dépôt) : python src/test/bench_prefix_cache.py [n_docs]
+Modèle : settings.model_name / MODEL_LOCAL_DIR (CPU conseillé pour la mesure).
+"""
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.infer import get_model
+
+# --- 1. Documents de test ---
+def sample_doc(i: int, n_consultations: int) -> str:
+    lines = [f"Patient : Jean Dupont {i}, né le 12/05/1980, sexe M."]
+    for k in range(n_consultations):
+        lines.append(f"Consultation du {1 + k % 28:02d}/03/2022 : contrôle tensionnel, TA 14/9, "
+                     f"poursuite amlodipine 5 mg.")
+    return "\n".join(lines)
+
+# --- 2. Mesures ---
+def ttft_ms(model, text: str, use_prefix_cache: bool) -> float:
+    t0 = time.perf_counter()
+    model.generate(text, max_new_tokens=1, use_prefix_cache=use_prefix_cache)
+    return (time.perf_counter() - t0) * 1000
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    t0 = time.perf_counter()
+    model = get_model()
+    print(f"🚀 Modèle chargé en {time.perf_counter() - t0:.1f} s")
+
+    t0 = time.perf_counter()
+    prefix_ids, _, _ = model.prefix_state()
+    print(f"🧠 Préfixe : {prefix_ids.shape[1]} tokens (calculé en {(time.perf_counter() - t0) * 1000:.0f} ms, une fois)")
+
+    doc = sample_doc(0, 3)
+    a = model.generate(doc, max_new_tokens=24, use_prefix_cache=False)
+    b = model.generate(doc, max_new_tokens=24, use_prefix_cache=True)
+    print(f"🧪 Sorties identiques : {a == b}")
+    if a != b:
+        print(f"   sans : {a!r}\n   avec : {b!r}")
+
+    print("\n⏱️  TTFT médian (ms)        sans cache   avec cache")
+    for n_consultations in (1, 10, 40):
+        docs = [sample_doc(i, n_consultations) for i in range(n)]
+        ttft_ms(model, docs[0], True)  # chauffe
+        without = statistics.median(ttft_ms(model, d, False) for d in docs)
+        with_cache = statistics.median(ttft_ms(model, d, True) for d in docs)
+        label = f"{n_consultations} consultation(s)"
+        print(f"   {label:<24} {without:10.0f} {with_cache:12.0f}   x{without / with_cache:.1f}")
@@ -0,0 +1,131 @@
+"""
+Test + benchmark du micro-batching de la génération locale (app/scheduler.py),
+avec un faux modèle dont le coût d'un lot est fixe + petit coût par document
+(comme un generate() sur CPU, où la matrice d'un seul document sous-utilise le calcul) :
+1) requêtes concurrentes : chaque sortie revient à son appelant, lots > 1 ;
+2) annulation et close() : aucune requête ne reste bloquée ;
+3) chemin d'extraction (provider='local') : process_text_async passe par le planificateur ;
+4) débit et histogrammes taille de lot / attente en file, lots de 1 vs lots de N.
+
+Usage (depuis la racine du dépôt) : python src/test/bench_scheduler.py [n_requêtes]
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+import app.scheduler as scheduler_mod
+from app.scheduler import BatchScheduler
+from app.settings import settings
+
+BATCH_FIXED_S = 0.05     # coût d'un appel generate, quel que soit le lot
+PER_DOC_S = 0.004        # coût marginal par document du lot
+
+# --- 1. Faux modèle ---
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_batch(self, texts: list) -> list:
+        with self.lock:
+            self.calls += 1
+        time.sleep(BATCH_FIXED_S + PER_DOC_S * len(texts))
+        return [json.dumps({"patient": {"nom": t}}) for t in texts]
+
+def run_concurrent(sched: BatchScheduler, n: int, concurrency: int) -> float:
+    def one(i: int) -> None:
+        out = sched.generate(f"doc-{i}")
+        assert json.loads(out)["patient"]["nom"] == f"doc-{i}", f"sortie mal routée pour doc-{i}"
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(n)))
+    return time.perf_counter() - t0
+
+# --- 2. Exactitude ---
+def check_routing(n: int) -> None:
+    model = FakeModel()
+    sched = BatchScheduler(model.generate_batch, max_batch=8, max_wait_ms=20)
+    run_concurrent(sched, n, concurrency=16)
+    mean = sched.requests / sched.batches
+    print(f"🧪 {n} requêtes routées vers leur appelant en {sched.batches} lots (moyenne {mean:.1f})")
+    assert sched.batches == model.calls and mean > 1, "aucun lot de plus d'une requête"
+    sched.close()
+
+def check_cancel_and_close() -> None:
+    release = threading.Event()
+    sched = BatchScheduler(lambda texts: (release.wait(), texts)[1], max_batch=1, max_wait_ms=0)
+    running = sched.submit("en cours")
+    while not running.running():
+        time.sleep(0.001)
+    cancelled = sched.submit("annulée")
+    assert cancelled.cancel()
+    queued = [sched.submit(f"en file {i}") for i in range(3)]
+    closer = threading.Thread(target=sched.close)
+    closer.start()
+    time.sleep(0.05)
+    release.set()
+    closer.join(timeout=5)
+    assert not closer.is_alive(), "close() bloqué"
+    assert running.result(timeout=1) == "en cours"
+    failed = 0
+    for fut in queued:
+        try:
+            fut.result(timeout=1)
+        except RuntimeError:
+            failed += 1
+    assert failed == len(queued), "requêtes en file non échouées par close()"
+    print(f"🧪 annulation ignorée par le lot, close() : lot en cours terminé, {failed} requêtes en file échouées")
+    assert sched.submit("après close").result(timeout=1) == "après close"  # redémarre le thread
+    sched.close()
+
+async def check_extraction_path(n: int) -> None:
+    from app.services.extractor import process_text_async
+
+    model = FakeModel()
+    scheduler_mod.close_scheduler()
+    scheduler_mod._scheduler = BatchScheduler(model.generate_batch, max_batch=8, max_wait_ms=20)
+    settings.provider = "local"
+    try:
+        results = await asyncio.gather(*(process_text_async(f"doc-{i}", use_cache=False) for i in range(n)))
+    finally:
+        settings.provider = "mistral_api"
+    assert [data["patient"]["nom"] for data, *_ in results] == [f"doc-{i}" for i in range(n)]
+    print(f"🧪 process_text_async (provider='local') : {n} extractions en {model.calls} appels du modèle")
+    assert model.calls < n
+    scheduler_mod.close_scheduler()
+
+# --- 3. Débit ---
+def fmt_hist(snapshot: dict) -> str:
+    prev, parts = 0, []
+    for bound, total in snapshot["buckets"].items():
+        if total - prev:
+            parts.append(f"≤{bound}: {total - prev}")
+        prev = total
+    return ", ".join(parts)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    check_routing(n)
+    check_cancel_and_close()
+    asyncio.run(check_extraction_path(32))
+
+    print(f"\n⏱️  {n} requêtes, 32 appelants concurrents, lot = {BATCH_FIXED_S * 1000:.0f} ms + "
+          f"{PER_DOC_S * 1000:.0f} ms/document")
+    for max_batch in (1, 8, 32):
+        # séries partagées dans /metrics : on remet à zéro pour chaque configuration
+        scheduler_mod.registry._histograms.clear()
+        sched = BatchScheduler(FakeModel().generate_batch, max_batch=max_batch, max_wait_ms=20)
+        wall = run_concurrent(sched, n, concurrency=32)
+        stats = sched.stats()
+        print(f"   lots ≤ {max_batch:<3} : {n / wall:7.1f} req/s, {stats['batches']:4d} lots, "
+              f"attente moy. {stats['queue_wait_ms']['mean']:7.1f} ms")
+        print(f"              taille de lot : {fmt_hist(stats['batch_size'])}")
+        if max_batch > 1:
+            assert stats["batch_size"]["mean"] > 1, "le micro-batching ne forme pas de lots"
+        sched.close()
@@ -0,0 +1,71 @@
+"""
+Benchmark du démarrage de l'API :
+1) temps d'import de app.main dans un processus neuf (médiane de n), avec un
+   QDRANT_HOST injoignable : l'import ne doit ouvrir aucune connexion ;
+2) modules les plus lents à l'import (python -X importtime) ;
+3) durée du lifespan jusqu'à « prêt », sans puis avec warmup (Qdrant en mémoire).
+
+Usage (depuis la racine du dépôt) : python src/test/bench_startup.py [n]
+"""
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+# adresse non routable : un client créé à l'import bloquerait ou échouerait ici
+ENV = {**os.environ, "QDRANT_HOST": "http://10.255.255.1:6333", "WARMUP_ON_STARTUP": "false"}
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+# --- 1. Temps d'import ---
+def import_times(n: int) -> list[float]:
+    out = []
+    for _ in range(n):
+        res = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=ENV,
+                             capture_output=True, text=True, timeout=60, check=True)
+        out.append(float(res.stdout.strip().splitlines()[-1]) * 1000)
+    return out
+
+# --- 2. Modules les plus coûteux ---
+def slowest_imports(top: int = 12) -> list[tuple[int, str]]:
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=ROOT, env=ENV,
+                         capture_output=True, text=True, timeout=60, check=True)
+    rows = []
+    for line in res.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m and len(m.group(2)) <= 3:  # modules de premier niveau seulement
+            rows.append((int(m.group(1)), m.group(3)))
+    return sorted(rows, reverse=True)[:top]
+
+# --- 3. Lifespan ---
+async def lifespan_ms(app, warmup: bool) -> float:
+    from app.settings import settings
+
+    settings.warmup_on_startup = warmup
+    t0 = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+    return (ready - t0) * 1000
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    times = import_times(n)
+    print(f"📦 import app.main : médiane {statistics.median(times):.0f} ms "
+          f"(min {min(times):.0f}, max {max(times):.0f}, n={n}) — Qdrant injoignable : OK")
+
+    print("\n🐢 Imports les plus lents (cumulé, ms)")
+    for us, name in slowest_imports():
+        print(f"   {us / 1000:8.1f}  {name}")
+
+    sys.path.insert(0, str(ROOT))
+    os.environ.update(ENV)
+    os.environ["QDRANT_HOST"] = ":memory:"  # le warmup ouvre vraiment la connexion
+    from app.main import app
+
+    print("\n🚀 Lifespan (démarrage jusqu'à prêt)")
+    print(f"   sans warmup : {asyncio.run(lifespan_ms(app, False)):8.1f} ms")
+    print(f"   avec warmup : {asyncio.run(lifespan_ms(app, True)):8.1f} ms  → {app.state.warmup}")
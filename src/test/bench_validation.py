@@ -0,0 +1,71 @@
+"""
+Micro-benchmark de la validation JSON Schema d'un MedicalRecord :
+- avant : jsonschema.validate(instance, schema) à chaque document
+- après : app.services.extractor.validate_json (validateur compilé une fois)
+
+Usage (depuis la racine du dépôt) : python src/test/bench_validation.py [n]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+from jsonschema import validate, ValidationError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.services.extractor import SCHEMA, validate_json
+
+# --- 1. Documents de test ---
+def sample_record(n_items: int = 10) -> dict:
+    return {
+        "patient": {"id": None, "nom": "Jean Dupont", "date_naissance": "1980-05-12",
+                    "sexe": "M", "adresse": "Rue des Lilas, 12345 Villeville"},
+        "antecedents_medicaux": [
+            {"condition": f"Condition {i}", "date_diagnostic": "2010-01-01", "status": "active",
+             "type": None, "gravite": None} for i in range(n_items)
+        ],
+        "traitements_actuels": [
+            {"medicament": f"Médicament {i}", "dose": "500 mg", "posologie": "2x/jour",
+             "indication": None, "debut_traitement": "2020-03-01", "fin_traitement": None}
+            for i in range(n_items)
+        ],
+        "consultations": [
+            {"date": f"2022-{1 + i % 12:02d}-15", "motif": "Contrôle", "observations": None,
+             "diagnostic": "RAS", "traitement_prescrit": None} for i in range(n_items)
+        ],
+        "examens": [{"date": "2022-09-12", "type": "NFS", "resultat": "normal"}],
+        "resume_structure": {
+            "maladies": [{"nom": "Hypertension artérielle", "premiere_mention": "2010-01-01",
+                          "statut": "active", "derniere_consultation": "2022-09-12", "confiance": 0.9}],
+            "allergies": ["Pénicilline"],
+            "traitements": ["Amlodipine"],
+        },
+        "meta": {"langue": "fr", "source": "pdf", "date_extraction": "2024-01-01",
+                 "modele_utilise": "mistral-medium", "confiance_moyenne": 0.8, "schema_version": "1.0"},
+        "document_source": {"nom_fichier": "file1.pdf", "type": "pdf", "id_document": None},
+    }
+
+def invalid_record() -> dict:
+    rec = sample_record()
+    rec["patient"]["date_naissance"] = "12/05/1980"
+    rec["consultations"][0]["diagnostic"] = 42
+    rec["resume_structure"]["maladies"][0]["confiance"] = 1.5
+    del rec["meta"]["modele_utilise"]
+    return rec
+
+# --- 2. Avant / après ---
+def before(doc: dict):
+    try:
+        validate(instance=doc, schema=SCHEMA)
+        return True, None
+    except ValidationError as e:
+        return False, e.message
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    for label, doc in (("valide", sample_record()), ("invalide", invalid_record())):
+        t_before = timeit.timeit(lambda: before(doc), number=n) / n
+        t_after = timeit.timeit(lambda: validate_json(doc), number=n) / n
+        print(f"📄 Document {label} ({n} itérations)")
+        print(f"   avant : {t_before * 1e6:9.1f} µs/doc  → {before(doc)[1]}")
+        print(f"   après : {t_after * 1e6:9.1f} µs/doc  → {validate_json(doc)[1]}")
+        print(f"   gain  : x{t_before / t_after:.1f}\n")
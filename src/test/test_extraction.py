@@ -1,18 +1,16 @@
-import pdfplumber
+import sys
 import json
 from datetime import datetime
 from pathlib import Path
 
+# racine du dépôt dans le path pour réutiliser l'extraction PDF de l'API
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.services.pdf_text import extract_text_from_pdf
+
 # --- 1. Définir le chemin du fichier PDF à tester ---
 PDF_PATH = Path("data/file1.pdf")
 
-# --- 2. Fonction d'extraction du texte ---
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-    return text.strip()
+# --- 2. Extraction du texte : app.services.pdf_text.extract_text_from_pdf ---
 
 # --- 3. Fonction de conversion basique vers un JSON structuré ---
 def build_structured_json(raw_text):